@@ -1,14 +1,28 @@
+import os
+import queue
+import threading
 import torch
 import numpy as np
 import time
+from collections import deque
 from src.ai.model import Simple3DUNet
+from src.ai.sliding_window import (sliding_window_inference, auto_batch_size,
+                                   PatchAccumulator, run_patches)
+from src.ai.optimize import BACKEND_MODES, build_backend, check_backends, print_backend_report
+from src.ai.patching import InferenceCancelled
+from src.ai.preprocessing import prepare_input
+from src.core.structure import BRATS_LABELS
+from src.core.tracing import span
 
 class TumorSegmentor:
     """
     Wrapper class for the 3D U-Net Model.
     Handles data preprocessing, device management (CPU/GPU), and inference logic.
+    Inference runs patch by patch (sliding window), so memory stays bounded
+    by patch_size and memory_budget_mb instead of growing with the volume.
     """
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, patch_size=(128, 128, 128), overlap=0.25,
+                 memory_budget_mb=2048, batch_size=None, backend='fp32', verbose=False):
         # 1. Setup Device
         # Uses CUDA (Nvidia) if available, otherwise CPU.
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -16,79 +30,246 @@ class TumorSegmentor:
 
         # 2. Load Architecture
         # Instantiating the U-Net i built in model.py
-        self.model = Simple3DUNet(in_channels=4, out_channels=3)
+        # One output channel per BraTS class, so argmax maps straight onto BRATS_LABELS
+        self.model = Simple3DUNet(in_channels=4, out_channels=len(BRATS_LABELS))
         self.model.to(self.device) # Move model to VRAM
         
-        # 3. Load Weights (Optional/Future Proof)
+        # 3. Load Weights (Optional)
         if model_path:
-            # In a real scenario, i would load the trained weights here.
-            # self.model.load_state_dict(torch.load(model_path))
+            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
             print(f" Weights loaded from {model_path}")
         else:
-            print(" No pre-trained weights found. Running in SIMULATION mode.")
+            print(" No pre-trained weights found. Running with untrained weights.")
+
+        # 4. Sliding window settings
+        # The U-Net pools twice, so patch sides must be multiples of 4
+        if any(p % 4 for p in patch_size):
+            raise ValueError(f"Patch size must be a multiple of 4 on every axis, got {patch_size}")
+        self.patch_size = tuple(patch_size)
+        self.overlap = overlap
+        # Patches per forward pass: given explicitly, or the most that fit the memory budget
+        self.batch_size = batch_size or auto_batch_size(self.patch_size, memory_budget_mb)
+        # Per-call console messages of predict()
+        self.verbose = verbose
+
+        # 5. Execution backend (see BACKEND_MODES); 'fp32' runs the eager model as-is
+        self.set_backend(backend)
+
+    def _example_input(self):
+        return torch.randn((1, 4) + self.patch_size)
+
+    def set_backend(self, mode, example_input=None):
+        """
+        Switches the execution backend: 'fp32', 'fold_bn', 'channels_last', 'torchscript',
+        'compile', 'bf16' or 'int8_static'. example_input (1, 4, *patch) is used for
+        tracing and int8 calibration; pass a real preprocessed patch for best int8 accuracy.
+        """
+        if example_input is None and mode in ('torchscript', 'int8_static'):
+            example_input = self._example_input()
+        self.model.eval()
+        self.runner = build_backend(self.model, mode, self.device, example_input)
+        self.backend = mode
+        print(f" Inference backend: {mode}")
+
+    def select_backend(self, example_input=None, modes=BACKEND_MODES, **tolerances):
+        """
+        Runs the parity check of every mode against the fp32 reference, prints the report,
+        and switches to the fastest mode within tolerance (max_abs_diff, min_dice).
+        Returns the per-mode results.
+        """
+        if example_input is None:
+            example_input = self._example_input()
+        self.model.eval()
+        results = check_backends(self.model, example_input, self.device, modes, **tolerances)
+        print_backend_report(results)
+
+        passing = [r for r in results if r["ok"]]
+        if passing:
+            best = min(passing, key=lambda r: r["seconds"])
+            self.set_backend(best["mode"], example_input)
+        return results
 
     def preprocess(self, patient_volume):
         """
         Converts patient data into a format the AI can understand.
-        Numpy (H, W, D) -> Tensor (Batch, Channel, D, H, W)
+        Numpy (H, W, D) -> Tensor (Batch, Channel, D, H, W), cropped to the brain
+        bounding box and z-score normalized per modality (see prepare_input).
+        Returns the tensor and the ForegroundCrop needed to paste the prediction back.
         """
-        # Stack all modalities: (4, D, H, W)
-        modalities = [
-            patient_volume.modalities['t1'],
-            patient_volume.modalities['t1ce'],
-            patient_volume.modalities['t2'],
-            patient_volume.modalities['flair']
-        ]
-        
-        # Check if any modality is missing/None
-        valid_mods = [m for m in modalities if m is not None]
-        if len(valid_mods) < 4:
-            raise ValueError("AI requires all 4 modalities (T1, T1ce, T2, FLAIR).")
-
-        stacked = np.stack(valid_mods, axis=0)
-        
-        # Convert to Tensor and float32
-        tensor = torch.from_numpy(stacked).float()
+        volume, crop = prepare_input(patient_volume)
         
         # Add Batch Dimension: (1, 4, D, H, W)
-        tensor = tensor.unsqueeze(0)
+        tensor = torch.from_numpy(volume).unsqueeze(0)
         
-        return tensor.to(self.device)
+        return tensor.to(self.device), crop
 
-    def predict(self, patient_volume):
+    def predict(self, patient_volume, progress_callback=None, stage_callback=None, cancel_event=None):
         """
         Runs the inference pipeline.
+        Returns the predicted mask with BraTS labels {0, 1, 2, 4}, same shape as the modalities.
+        progress_callback(done, total) is called after each batch of patches.
+        stage_callback(stage, done, total) reports 'preprocess', 'forward' (per patch batch)
+        and 'postprocess'. Setting cancel_event (a threading.Event) raises InferenceCancelled
+        at the next stage or patch batch boundary.
         """
-        print("AI Inference Request received...")
+        if self.verbose:
+            print("AI Inference Request received...")
         t0 = time.time()
 
+        def stage(name, done, total):
+            if cancel_event is not None and cancel_event.is_set():
+                raise InferenceCancelled()
+            if stage_callback is not None:
+                stage_callback(name, done, total)
+
+        def forward_progress(done, total):
+            if progress_callback is not None:
+                progress_callback(done, total)
+            stage('forward', done, total)
+
         # 1. Prepare Data
-        # Even though we mock the result, we run preprocessing 
-        # to prove the data pipeline works.
+        stage('preprocess', 0, 1)
         try:
-            _ = self.preprocess(patient_volume)
+            with span("preprocess", case=patient_volume.id):
+                input_tensor, crop = self.preprocess(patient_volume)
         except Exception as e:
             print(f"Preprocessing Error: {e}")
             return None
+        stage('preprocess', 1, 1)
 
         # 2. Set Model to Eval Mode
         # Critical: Disables Dropout & Batch Norm updates
         self.model.eval()
 
-        # 3. Run Inference (No Gradients)
-        with torch.no_grad():
-            # SIMULATION BLOCK
-            # Real model output would be: output = self.model(input_tensor)
-            # We simulate the computation time of 3D Convolutions
-            time.sleep(2.0) 
-            
-            # MOCK OUTPUT
-            # Returning the ground truth mask as if the AI predicted it.
-            if patient_volume.mask is not None:
-                result = patient_volume.mask
-            else:
-                print("No mask available for simulation.")
-                result = None
-
-        print(f"AI processing finished in {time.time() - t0:.2f}s")
-        return result
\ No newline at end of file
+        # 3. Run Inference (No Gradients), patch by patch
+        with span("forward", case=patient_volume.id):
+            probs = sliding_window_inference(
+                self.runner, input_tensor[0], n_classes=len(BRATS_LABELS),
+                patch_size=self.patch_size, overlap=self.overlap,
+                batch_size=self.batch_size, device=self.device,
+                progress_callback=forward_progress, cancel_event=cancel_event
+            )
+
+        # 4. Class index -> BraTS label, back in full-volume coordinates
+        stage('postprocess', 0, 1)
+        with span("postprocess", case=patient_volume.id):
+            result = crop.paste(self._to_labels(probs))
+        stage('postprocess', 1, 1)
+
+        if self.verbose:
+            print(f"AI processing finished in {time.time() - t0:.2f}s")
+        return result
+
+    def _to_labels(self, probs):
+        classes = torch.argmax(probs, dim=0).numpy().astype(np.uint8)
+        return BRATS_LABELS[classes]
+
+    def predict_many(self, cases, loader=None, prefetch=2, batch_size=None, num_threads=None):
+        """
+        Throughput mode for cohort runs. Yields (patient_id, mask) as each case completes,
+        in input order; mask is None when a case could not be loaded or preprocessed.
+
+        `cases` holds PatientVolume objects or case ids (ids need `loader`).
+        A background thread loads and preprocesses up to `prefetch` cases ahead while
+        the model runs, and every forward batch is filled with patches from as many
+        cases as needed, so batches stay full across case boundaries.
+        """
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        batch_size = batch_size or self.batch_size
+        n_classes = len(BRATS_LABELS)
+        self.model.eval()
+
+        # --- Producer: load + preprocess ahead of the model ---
+        ready = queue.Queue(maxsize=max(1, prefetch))
+        stop = threading.Event()
+        done_marker = object()
+
+        def produce():
+            for case in cases:
+                if stop.is_set():
+                    break
+                case_id = case if isinstance(case, str) else case.id
+                try:
+                    patient = loader.load_patient(case) if isinstance(case, str) else case
+                    tensor, crop = self.preprocess(patient)
+                    item = (case_id, PatchAccumulator(tensor[0], n_classes, self.patch_size, self.overlap), crop)
+                except Exception as e:
+                    print(f"Skipping {case_id}: {e}")
+                    item = (case_id, None, None)
+                ready.put(item)
+            ready.put(done_marker)
+
+        producer = threading.Thread(target=produce, name="predict-prefetch", daemon=True)
+        producer.start()
+
+        # --- Consumer: pack patches of consecutive cases into full batches ---
+        t0 = time.time()
+        n_cases = 0
+        active = deque()     # (case_id, accumulator or None, crop), in input order
+        next_patch = {}      # id(accumulator) -> index of its next unscheduled window
+        exhausted = False
+
+        try:
+            while True:
+                # Stream out finished (or failed) cases at the head of the line.
+                # Patches are scheduled in case order, so cases finish in input order.
+                while active and (active[0][1] is None or active[0][1].finished):
+                    case_id, acc, crop = active.popleft()
+                    n_cases += 1
+                    if acc is None:
+                        yield case_id, None
+                    else:
+                        del next_patch[id(acc)]
+                        yield case_id, crop.paste(self._to_labels(acc.result()))
+
+                # Top up the active cases until a full batch of patches is available.
+                # Only wait for the producer when there is nothing else to run.
+                pending = sum(acc.total - next_patch[id(acc)] for _, acc, _ in active if acc is not None)
+                while not exhausted and pending < batch_size:
+                    try:
+                        item = ready.get(block=not active)
+                    except queue.Empty:
+                        break
+                    if item is done_marker:
+                        exhausted = True
+                        break
+                    active.append(item)
+                    if item[1] is not None:
+                        next_patch[id(item[1])] = 0
+                        pending += item[1].total
+
+                if exhausted and not active:
+                    break
+
+                # Gather one batch across cases
+                batch = []
+                for _, acc, _ in active:
+                    if acc is None:
+                        continue
+                    while next_patch[id(acc)] < acc.total and len(batch) < batch_size:
+                        window = acc.windows[next_patch[id(acc)]]
+                        batch.append((acc, window))
+                        next_patch[id(acc)] += 1
+                    if len(batch) == batch_size:
+                        break
+
+                if not batch:
+                    continue
+
+                out = run_patches(self.runner, [acc.patch(w) for acc, w in batch], self.device)
+                for j, (acc, window) in enumerate(batch):
+                    acc.add(window, out[j])
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue
+            while producer.is_alive():
+                try:
+                    ready.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.1)
+
+            elapsed = time.time() - t0
+            if n_cases:
+                print(f"AI batch: {n_cases} cases in {elapsed:.1f}s "
+                      f"({60.0 * n_cases / max(elapsed, 1e-9):.2f} cases/min, batch size {batch_size})")
@@ -0,0 +1,132 @@
+import os
+import time
+import numpy as np
+from typing import Callable, Optional, Sequence
+from src.ai.patching import InferenceCancelled, auto_batch_size, gaussian_weights, patch_windows
+from src.ai.preprocessing import prepare_input
+from src.core.structure import BRATS_LABELS
+from src.core.tracing import span
+
+class OnnxSegmentor:
+    """
+    CPU inference engine running an exported U-Net graph (see onnx_export.py)
+    with onnxruntime. Same predict interface as TumorSegmentor, but it only
+    needs numpy and onnxruntime, so the GUI process never imports torch.
+    """
+    def __init__(self, onnx_path: str, patch_size=(128, 128, 128), overlap=0.25,
+                 memory_budget_mb=2048, batch_size=None,
+                 intra_op_threads: int = 0, inter_op_threads: int = 0, verbose: bool = False):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("OnnxSegmentor needs onnxruntime (pip install onnxruntime)") from e
+
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"No ONNX model: {onnx_path}")
+
+        # 0 lets onnxruntime pick (one intra-op thread per physical core)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        print(f"🧠 AI Engine initializing on: onnxruntime CPU ({onnx_path})")
+
+        if any(p % 4 for p in patch_size):
+            raise ValueError(f"Patch size must be a multiple of 4 on every axis, got {patch_size}")
+        self.patch_size = tuple(patch_size)
+        self.overlap = overlap
+        self.batch_size = batch_size or auto_batch_size(self.patch_size, memory_budget_mb)
+        self.backend = 'onnxruntime'
+        # Per-call console messages of predict(), as in TumorSegmentor
+        self.verbose = verbose
+
+    def preprocess(self, patient_volume):
+        """(4, d, h, w) float32 input cropped to the brain and normalized, plus its ForegroundCrop."""
+        return prepare_input(patient_volume)
+
+    def _run(self, patches) -> np.ndarray:
+        """One forward pass over a list of patches; softmax probabilities."""
+        logits = self.session.run(None, {self.input_name: np.stack(patches)})[0]
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def sliding_window(self, volume: np.ndarray,
+                       progress_callback: Optional[Callable[[int, int], None]] = None,
+                       cancel_event=None) -> np.ndarray:
+        """
+        Gaussian-blended patch inference over a (C, D, H, W) volume, the numpy
+        counterpart of sliding_window_inference. Returns (n_classes, D, H, W) probabilities.
+        """
+        spatial = volume.shape[1:]
+        pad = [(0, 0)] + [(0, max(p - s, 0)) for p, s in zip(self.patch_size, spatial)]
+        if any(after for _, after in pad):
+            volume = np.pad(volume, pad)
+        padded = volume.shape[1:]
+
+        windows = patch_windows(padded, self.patch_size, self.overlap)
+        importance = gaussian_weights(self.patch_size)
+        probs = np.zeros((len(BRATS_LABELS),) + padded, dtype=np.float32)
+        weights = np.zeros(padded, dtype=np.float32)
+
+        for i in range(0, len(windows), self.batch_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise InferenceCancelled()
+            batch = windows[i:i + self.batch_size]
+            out = self._run([volume[(slice(None),) + w] for w in batch])
+            for j, w in enumerate(batch):
+                probs[(slice(None),) + w] += out[j] * importance
+                weights[w] += importance
+
+            if progress_callback is not None:
+                progress_callback(min(i + self.batch_size, len(windows)), len(windows))
+
+        probs /= weights
+        return probs[(slice(None),) + tuple(slice(0, s) for s in spatial)]
+
+    def predict(self, patient_volume, progress_callback=None, stage_callback=None, cancel_event=None):
+        """
+        Returns the predicted mask with BraTS labels {0, 1, 2, 4}, same shape as the modalities.
+        progress_callback(done, total) is called after each batch of patches; stage_callback
+        and cancel_event behave as in TumorSegmentor.predict.
+        """
+        if self.verbose:
+            print("AI Inference Request received...")
+        t0 = time.time()
+
+        def stage(name, done, total):
+            if cancel_event is not None and cancel_event.is_set():
+                raise InferenceCancelled()
+            if stage_callback is not None:
+                stage_callback(name, done, total)
+
+        def forward_progress(done, total):
+            if progress_callback is not None:
+                progress_callback(done, total)
+            stage('forward', done, total)
+
+        stage('preprocess', 0, 1)
+        try:
+            with span("preprocess", case=patient_volume.id):
+                volume, crop = self.preprocess(patient_volume)
+        except Exception as e:
+            print(f"Preprocessing Error: {e}")
+            return None
+        stage('preprocess', 1, 1)
+
+        with span("forward", case=patient_volume.id):
+            probs = self.sliding_window(volume, forward_progress, cancel_event)
+
+        stage('postprocess', 0, 1)
+        with span("postprocess", case=patient_volume.id):
+            result = crop.paste(BRATS_LABELS[np.argmax(probs, axis=0).astype(np.uint8)])
+        stage('postprocess', 1, 1)
+
+        if self.verbose:
+            print(f"AI processing finished in {time.time() - t0:.2f}s")
+        return result
@@ -0,0 +1,51 @@
+import argparse
+import torch
+from typing import Optional, Sequence
+from src.ai.model import Simple3DUNet
+from src.ai.optimize import fold_batchnorm
+from src.core.structure import BRATS_LABELS
+
+ONNX_INPUT = "input"
+ONNX_OUTPUT = "logits"
+DEFAULT_OPSET = 17
+
+def export_onnx(model: torch.nn.Module, onnx_path: str,
+                patch_size: Sequence[int] = (128, 128, 128), opset: int = DEFAULT_OPSET) -> str:
+    """
+    Exports the network to ONNX for OnnxSegmentor. The batch and the three spatial axes
+    are dynamic, so the graph accepts any patch size that is a multiple of 4
+    (patch_size only shapes the tracing input). BatchNorm is folded into the
+    convolutions before export. Returns onnx_path.
+    """
+    folded = fold_batchnorm(model).cpu()
+    example_input = torch.randn((1, 4) + tuple(patch_size))
+
+    torch.onnx.export(
+        folded, (example_input,), onnx_path,
+        input_names=[ONNX_INPUT], output_names=[ONNX_OUTPUT],
+        dynamic_axes={
+            ONNX_INPUT: {0: "batch", 2: "d", 3: "h", 4: "w"},
+            ONNX_OUTPUT: {0: "batch", 2: "d", 3: "h", 4: "w"}
+        },
+        opset_version=opset
+    )
+    print(f"Exported ONNX model to {onnx_path}")
+    return onnx_path
+
+def export_checkpoint(model_path: Optional[str], onnx_path: str,
+                      patch_size: Sequence[int] = (128, 128, 128), opset: int = DEFAULT_OPSET) -> str:
+    """Builds Simple3DUNet as TumorSegmentor does, loads the weights (if any) and exports it."""
+    model = Simple3DUNet(in_channels=4, out_channels=len(BRATS_LABELS))
+    if model_path:
+        model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    return export_onnx(model, onnx_path, patch_size, opset)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the 3D U-Net to ONNX.")
+    parser.add_argument("onnx_path", help="Output .onnx file")
+    parser.add_argument("--weights", default=None, help="State dict to load (untrained weights if omitted)")
+    parser.add_argument("--patch", type=int, default=128, help="Side of the tracing patch (multiple of 4)")
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    args = parser.parse_args()
+
+    export_checkpoint(args.weights, args.onnx_path, (args.patch,) * 3, args.opset)
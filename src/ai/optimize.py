@@ -0,0 +1,169 @@
+import copy
+import contextlib
+import time
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from typing import Dict, List, Optional, Sequence
+
+# Backend modes, from the fp32 reference to the most aggressive optimization.
+# Every mode except 'fp32' starts from the BatchNorm-folded network.
+BACKEND_MODES = ('fp32', 'fold_bn', 'channels_last', 'torchscript', 'compile', 'bf16', 'int8_static')
+
+def fold_batchnorm(model: nn.Module) -> nn.Module:
+    """
+    Returns an eval-mode copy of the model where every Conv3d directly followed by
+    a BatchNorm3d (inside an nn.Sequential) absorbs the normalization into its
+    weights and bias. The BatchNorm layers become Identity.
+    """
+    folded = copy.deepcopy(model).eval()
+    for module in folded.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        for i in range(len(module) - 1):
+            conv, bn = module[i], module[i + 1]
+            if isinstance(conv, nn.Conv3d) and isinstance(bn, nn.BatchNorm3d):
+                module[i] = fuse_conv_bn_eval(conv, bn)
+                module[i + 1] = nn.Identity()
+    return folded
+
+class InferenceBackend:
+    """
+    Callable wrapper around an (optimized) network: batch in, float32 logits out.
+    Hides the per-mode input layout (channels_last_3d) and autocast context.
+    """
+    def __init__(self, module, mode: str, device: torch.device,
+                 channels_last: bool = False, autocast_dtype: Optional[torch.dtype] = None):
+        self.module = module
+        self.mode = mode
+        self.device = device
+        self.channels_last = channels_last
+        self.autocast_dtype = autocast_dtype
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last_3d)
+
+        if self.autocast_dtype is not None:
+            ctx = torch.autocast(self.device.type, dtype=self.autocast_dtype)
+        else:
+            ctx = contextlib.nullcontext()
+
+        with torch.no_grad(), ctx:
+            out = self.module(batch)
+        return out.float().contiguous()
+
+def build_backend(model: nn.Module, mode: str, device: torch.device,
+                  example_input: Optional[torch.Tensor] = None) -> InferenceBackend:
+    """
+    Prepares the network for one backend mode (see BACKEND_MODES).
+    'torchscript' and 'int8_static' need an example input (tracing / calibration);
+    int8 quantized kernels only exist on the CPU.
+    """
+    if mode not in BACKEND_MODES:
+        raise ValueError(f"Unknown backend mode '{mode}', expected one of {BACKEND_MODES}")
+
+    model = model.eval()
+    if mode == 'fp32':
+        return InferenceBackend(model, mode, device)
+
+    folded = fold_batchnorm(model).to(device)
+
+    if mode == 'fold_bn':
+        return InferenceBackend(folded, mode, device)
+
+    if mode == 'channels_last':
+        folded = folded.to(memory_format=torch.channels_last_3d)
+        return InferenceBackend(folded, mode, device, channels_last=True)
+
+    if mode == 'bf16':
+        return InferenceBackend(folded, mode, device, autocast_dtype=torch.bfloat16)
+
+    if mode == 'compile':
+        return InferenceBackend(torch.compile(folded), mode, device)
+
+    if example_input is None:
+        raise ValueError(f"Backend mode '{mode}' needs an example input")
+    example_input = example_input.to(device)
+
+    if mode == 'torchscript':
+        with torch.no_grad():
+            scripted = torch.jit.trace(folded, example_input)
+        return InferenceBackend(torch.jit.freeze(scripted), mode, device)
+
+    # int8_static: FX graph mode handles the torch.cat skip connections without model changes.
+    # (Dynamic quantization only covers Linear/RNN layers, so it would be a no-op on this all-conv net.)
+    if device.type != 'cpu':
+        raise ValueError("int8 quantized kernels are only available on the CPU")
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    prepared = prepare_fx(folded, get_default_qconfig_mapping('x86'), (example_input,))
+    with torch.no_grad():
+        prepared(example_input)  # calibration pass
+    return InferenceBackend(convert_fx(prepared), mode, device)
+
+def dice_score(a: torch.Tensor, b: torch.Tensor, n_classes: int) -> float:
+    """Mean Dice over the classes present in either label map."""
+    scores = []
+    for c in range(n_classes):
+        in_a, in_b = a == c, b == c
+        denom = int(in_a.sum()) + int(in_b.sum())
+        if denom == 0:
+            continue
+        scores.append(2.0 * int((in_a & in_b).sum()) / denom)
+    return float(sum(scores) / len(scores)) if scores else 1.0
+
+def _time_backend(backend: InferenceBackend, example_input: torch.Tensor, repeats: int):
+    out = backend(example_input)  # warm-up (compilation, tracing caches)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        out = backend(example_input)
+    return out, (time.perf_counter() - t0) / repeats
+
+def check_backends(model: nn.Module, example_input: torch.Tensor, device: torch.device,
+                   modes: Sequence[str] = BACKEND_MODES, repeats: int = 3,
+                   max_abs_diff: float = 1e-2, min_dice: float = 0.99) -> List[Dict]:
+    """
+    Parity and speed check of each mode against the fp32 reference on `example_input`.
+    Compares softmax probabilities (max abs diff) and argmax labels (Dice).
+    Returns one dict per mode: mode, seconds, speedup, max_abs_diff, dice, ok, error.
+    """
+    example_input = example_input.to(device)
+
+    reference = build_backend(model, 'fp32', device)
+    ref_out, ref_time = _time_backend(reference, example_input, repeats)
+    ref_probs = torch.softmax(ref_out, dim=1)
+    n_classes = ref_probs.shape[1]
+    ref_labels = ref_probs.argmax(dim=1)
+
+    results = []
+    for mode in modes:
+        row = {"mode": mode, "seconds": None, "speedup": None,
+               "max_abs_diff": None, "dice": None, "ok": False, "error": None}
+        try:
+            if mode == 'fp32':
+                out, seconds = ref_out, ref_time
+            else:
+                backend = build_backend(model, mode, device, example_input)
+                out, seconds = _time_backend(backend, example_input, repeats)
+            probs = torch.softmax(out, dim=1)
+            row["seconds"] = seconds
+            row["speedup"] = ref_time / seconds
+            row["max_abs_diff"] = float((probs - ref_probs).abs().max())
+            row["dice"] = dice_score(probs.argmax(dim=1), ref_labels, n_classes)
+            row["ok"] = row["max_abs_diff"] <= max_abs_diff and row["dice"] >= min_dice
+        except Exception as e:
+            row["error"] = str(e)
+        results.append(row)
+    return results
+
+def print_backend_report(results: List[Dict]):
+    print(f"{'mode':<14}{'time (s)':>10}{'speedup':>9}{'max diff':>11}{'dice':>8}  status")
+    for r in results:
+        if r["error"]:
+            print(f"{r['mode']:<14}{'-':>10}{'-':>9}{'-':>11}{'-':>8}  error: {r['error'][:60]}")
+            continue
+        status = "ok" if r["ok"] else "out of tolerance"
+        print(f"{r['mode']:<14}{r['seconds']:>10.3f}{r['speedup']:>9.2f}"
+              f"{r['max_abs_diff']:>11.2e}{r['dice']:>8.4f}  {status}")
@@ -0,0 +1,58 @@
+import itertools
+import numpy as np
+from typing import List, Sequence, Tuple
+
+# Peak activation memory of Simple3DUNet under no_grad, per input voxel of a patch
+# (measured on CPU: ~1 KB/voxel at 32-64-128 channels, float32).
+ACTIVATION_BYTES_PER_VOXEL = 1024
+
+# Patch grid helpers shared by the torch and onnxruntime engines (numpy only, no torch import).
+
+# Inference stages reported to stage_callback(stage, done, total)
+STAGES = ('preprocess', 'forward', 'postprocess')
+
+class InferenceCancelled(Exception):
+    """Raised between patch batches once the cancel event of a prediction is set."""
+
+def auto_batch_size(patch_size: Sequence[int], memory_budget_mb: float,
+                    bytes_per_voxel: int = ACTIVATION_BYTES_PER_VOXEL) -> int:
+    """
+    Largest number of patches per forward pass that fits in the memory budget (at least 1).
+    """
+    patch_bytes = int(np.prod(patch_size)) * bytes_per_voxel
+    return max(1, int(memory_budget_mb * 2**20 // patch_bytes))
+
+def gaussian_weights(patch_size: Tuple[int, ...], sigma_scale: float = 0.125) -> np.ndarray:
+    """
+    Gaussian weight map over a patch, highest at the center. Blending with it
+    hides the seams between overlapping patches, where predictions are least reliable.
+    """
+    axes = []
+    for size in patch_size:
+        coords = np.arange(size, dtype=np.float32) - (size - 1) / 2.0
+        sigma = size * sigma_scale
+        axes.append(np.exp(-0.5 * (coords / sigma) ** 2))
+
+    weights = axes[0][:, None, None] * axes[1][None, :, None] * axes[2][None, None, :]
+    weights /= weights.max()
+    # No voxel may end up with zero weight
+    weights = np.maximum(weights, weights[weights > 0].min())
+    return weights.astype(np.float32)
+
+def patch_starts(size: int, patch: int, step: int) -> List[int]:
+    """Start offsets along one axis; the last patch is aligned with the volume end."""
+    if size <= patch:
+        return [0]
+    starts = list(range(0, size - patch + 1, step))
+    if starts[-1] != size - patch:
+        starts.append(size - patch)
+    return starts
+
+def patch_windows(shape: Sequence[int], patch_size: Sequence[int], overlap: float) -> List[Tuple[slice, ...]]:
+    """
+    Slice tuples of all patches covering a volume of `shape` (already padded to
+    at least patch_size), with neighbouring patches overlapping by `overlap`.
+    """
+    steps = [max(1, int(p * (1.0 - overlap))) for p in patch_size]
+    starts = itertools.product(*[patch_starts(s, p, st) for s, p, st in zip(shape, patch_size, steps)])
+    return [tuple(slice(s, s + p) for s, p in zip(start, patch_size)) for start in starts]
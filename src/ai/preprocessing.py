@@ -0,0 +1,101 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Tuple
+from src.core.structure import MODALITIES
+
+@dataclass
+class ForegroundCrop:
+    """
+    Where the network input was cut from the full volume, so the prediction
+    can be pasted back. The crop may be zero-padded at the end of an axis
+    when the volume is too small to grow it to a multiple of 4.
+    """
+    full_shape: Tuple[int, int, int]    #Shape of the original volume
+    bbox: Tuple[Tuple[int, int], ...]   #Per axis (start, stop) in the full volume, stop is exclusive
+    pad: Tuple[int, int, int]           #Zero padding appended after the crop on each axis
+
+    @property
+    def slices(self) -> Tuple[slice, ...]:
+        return tuple(slice(start, stop) for start, stop in self.bbox)
+
+    def paste(self, cropped: np.ndarray, fill=0) -> np.ndarray:
+        """Puts a label map of the (padded) crop back into a full-volume array."""
+        full = np.full(self.full_shape, fill, dtype=cropped.dtype)
+        unpadded = tuple(slice(0, stop - start) for start, stop in self.bbox)
+        full[self.slices] = cropped[unpadded]
+        return full
+
+def _channels(patient_volume) -> List[np.ndarray]:
+    # Check if any modality is missing
+    if any(m not in patient_volume.modalities for m in MODALITIES):
+        raise ValueError("AI requires all 4 modalities (T1, T1ce, T2, FLAIR).")
+    if patient_volume.stacked is not None:
+        return [patient_volume.stacked[i] for i in range(len(MODALITIES))]
+    return [patient_volume.modalities[m] for m in MODALITIES]
+
+def foreground_mask(channels: List[np.ndarray]) -> np.ndarray:
+    """Voxels that are nonzero in at least one modality (the skull-stripped brain)."""
+    brain = channels[0] != 0
+    for channel in channels[1:]:
+        brain |= channel != 0
+    return brain
+
+def _axis_range(projection: np.ndarray) -> Tuple[int, int]:
+    hits = np.flatnonzero(projection)
+    return int(hits[0]), int(hits[-1]) + 1
+
+def foreground_crop(brain: np.ndarray, multiple: int = 4) -> ForegroundCrop:
+    """
+    Bounding box of the brain, grown (evenly on both sides, inside the volume)
+    to a multiple of `multiple`; whatever does not fit becomes end padding.
+    An empty volume keeps its full extent.
+    """
+    shape = brain.shape
+    if not brain.any():
+        bbox = [(0, s) for s in shape]
+    else:
+        # One reduction per axis over the other two, instead of np.nonzero on every brain voxel
+        bbox = [_axis_range(brain.any(axis=tuple(a for a in range(brain.ndim) if a != axis)))
+                for axis in range(brain.ndim)]
+
+    grown, pad = [], []
+    for (start, stop), size in zip(bbox, shape):
+        target = -(-(stop - start) // multiple) * multiple
+        fit = min(target, size)
+        start = max(0, start - (fit - (stop - start)) // 2)
+        stop = start + fit
+        if stop > size:
+            start, stop = size - fit, size
+        grown.append((start, stop))
+        pad.append(target - fit)
+
+    return ForegroundCrop(tuple(shape), tuple(grown), tuple(pad))
+
+def prepare_input(patient_volume, multiple: int = 4) -> Tuple[np.ndarray, ForegroundCrop]:
+    """
+    Network input of one case: the four modalities cropped to the brain bounding box
+    and z-score normalized per modality over brain voxels only (background stays 0).
+    Only the crop is ever converted to float32; the full grid is read once for the mask.
+    Returns the (4, d, h, w) float32 input and the crop to paste the prediction back with.
+    """
+    channels = _channels(patient_volume)
+    crop = foreground_crop(foreground_mask(channels), multiple)
+
+    window = crop.slices
+    brain = foreground_mask([channel[window] for channel in channels])
+    n_brain = int(brain.sum())
+
+    out = np.zeros((len(channels),) + tuple(s.stop - s.start + p for s, p in zip(window, crop.pad)),
+                   dtype=np.float32)
+    inner = tuple(slice(0, s.stop - s.start) for s in window)
+
+    for i, channel in enumerate(channels):
+        view = out[i][inner]
+        view[...] = channel[window]
+        if n_brain:
+            mean = view.mean(where=brain, dtype=np.float64)
+            std = view.std(where=brain, dtype=np.float64)
+            view -= mean
+            view /= std if std > 0 else 1.0
+            view *= brain
+    return out, crop
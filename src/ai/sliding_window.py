@@ -0,0 +1,97 @@
+import functools
+import torch
+import torch.nn.functional as F
+from typing import Callable, List, Optional, Sequence, Tuple
+from src.ai.patching import InferenceCancelled, auto_batch_size, gaussian_weights, patch_windows
+
+@functools.lru_cache(maxsize=8)
+def gaussian_importance_map(patch_size: Tuple[int, ...], sigma_scale: float = 0.125) -> torch.Tensor:
+    """Gaussian patch weights as a tensor, cached per patch size (treat as read-only)."""
+    return torch.from_numpy(gaussian_weights(patch_size, sigma_scale))
+
+class PatchAccumulator:
+    """
+    Sliding-window state of one volume: the patch grid, and the Gaussian-weighted
+    sum of the softmax outputs seen so far. Patches can be fed in any grouping,
+    which lets one forward batch mix patches of several cases.
+    """
+    def __init__(self, volume: torch.Tensor, n_classes: int,
+                 patch_size: Sequence[int] = (128, 128, 128), overlap: float = 0.25):
+        self.patch_size = tuple(int(p) for p in patch_size)
+        self.spatial = tuple(volume.shape[1:])
+
+        # Volumes smaller than a patch are zero-padded up to the patch size
+        pad = [max(p - s, 0) for p, s in zip(self.patch_size, self.spatial)]
+        if any(pad):
+            volume = F.pad(volume, (0, pad[2], 0, pad[1], 0, pad[0]))
+        self.volume = volume
+        padded = tuple(volume.shape[1:])
+
+        self.windows = patch_windows(padded, self.patch_size, overlap)
+
+        self.importance = gaussian_importance_map(self.patch_size)
+        self.probs = torch.zeros((n_classes,) + padded, dtype=torch.float32)
+        self.weights = torch.zeros(padded, dtype=torch.float32)
+        self.done = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.windows)
+
+    @property
+    def finished(self) -> bool:
+        return self.done == self.total
+
+    def patch(self, window) -> torch.Tensor:
+        return self.volume[(slice(None),) + window]
+
+    def add(self, window, probs: torch.Tensor):
+        """Blends the (n_classes, *patch_size) softmax output of one patch."""
+        self.probs[(slice(None),) + window] += probs * self.importance
+        self.weights[window] += self.importance
+        self.done += 1
+
+    def result(self) -> torch.Tensor:
+        """Blended class probabilities, cropped back to the original volume size."""
+        self.probs /= self.weights
+        crop = (slice(None),) + tuple(slice(0, s) for s in self.spatial)
+        return self.probs[crop]
+
+def run_patches(model: Callable, patches: List[torch.Tensor], device: torch.device) -> torch.Tensor:
+    """
+    One forward pass over a list of (C, *patch_size) patches; softmax output on the CPU.
+    `model` is an nn.Module or any callable returning logits (e.g. an InferenceBackend).
+    """
+    batch = torch.stack(patches).to(device, torch.float32)
+    with torch.no_grad():
+        return torch.softmax(model(batch), dim=1).float().cpu()
+
+def sliding_window_inference(model: Callable, volume: torch.Tensor, n_classes: int,
+                             patch_size: Sequence[int] = (128, 128, 128), overlap: float = 0.25,
+                             batch_size: int = 1, device: Optional[torch.device] = None,
+                             progress_callback: Optional[Callable[[int, int], None]] = None,
+                             cancel_event=None) -> torch.Tensor:
+    """
+    Runs `model` over (C, D, H, W) `volume` patch by patch and blends the softmax
+    outputs with Gaussian weights. Memory is bounded by the patch batch plus one
+    (n_classes, D, H, W) accumulator, independent of how large the volume is.
+    progress_callback(done, total) is called after each batch of patches.
+    Setting cancel_event (a threading.Event) stops before the next batch with InferenceCancelled.
+    Returns blended class probabilities, (n_classes, D, H, W) float32 on the CPU.
+    """
+    if device is None:
+        device = getattr(model, 'device', None) or next(model.parameters()).device
+
+    acc = PatchAccumulator(volume, n_classes, patch_size, overlap)
+    for i in range(0, acc.total, batch_size):
+        if cancel_event is not None and cancel_event.is_set():
+            raise InferenceCancelled()
+        windows = acc.windows[i:i + batch_size]
+        out = run_patches(model, [acc.patch(w) for w in windows], device)
+        for j, w in enumerate(windows):
+            acc.add(w, out[j])
+
+        if progress_callback is not None:
+            progress_callback(acc.done, acc.total)
+
+    return acc.result()
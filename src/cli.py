@@ -0,0 +1,208 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing as mp
+from typing import Dict, List, Optional
+
+from src.loaders.brats_loader import BraTSLoader
+from src.loaders.cohort_index import CohortIndex, DEFAULT_INDEX_NAME
+from src.core.analyzer import VolumeAnalyzer
+from src.core.tracing import TRACER
+
+# Tumor labels reported per case (BraTS convention)
+LABEL_NAMES = {
+    1: 'necrotic',
+    2: 'edema',
+    4: 'enhancing'
+}
+
+CASES_DIR = "cases"
+MESHES_DIR = "meshes"
+TRACES_DIR = "traces"
+RESULTS_NAME = "volumes"
+
+# Per-process state of the batch pool, set up once by _init_worker
+_worker = {}
+
+def _init_worker(root: str, out_dir: str, meshes: bool, brain: bool, trace: bool = False):
+    index = CohortIndex(root, index_path=os.path.join(out_dir, DEFAULT_INDEX_NAME))
+    _worker["loader"] = BraTSLoader(root, lazy=True, dtype=None, decode_workers=2, index=index)
+    _worker["analyzer"] = VolumeAnalyzer()
+    _worker["out_dir"] = out_dir
+    _worker["meshes"] = meshes
+    _worker["brain"] = brain
+    _worker["trace"] = trace
+    # Spans are only worth recording when they get written out
+    TRACER.enabled = trace
+
+def _write_json(path: str, data: Dict):
+    # Written under a temporary name and renamed, so a crashed case never looks complete
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _export_meshes(analyzer: VolumeAnalyzer, patient, out_dir: str, brain: bool) -> List[str]:
+    case_dir = os.path.join(out_dir, MESHES_DIR, patient.id)
+    os.makedirs(case_dir, exist_ok=True)
+
+    meshes = {LABEL_NAMES[lbl]: mesh for lbl, mesh in
+              analyzer.get_meshes_from_mask(patient, labels=tuple(LABEL_NAMES)).items()}
+    if brain and 't1' in patient.modalities:
+        meshes['brain'] = analyzer.get_brain_mesh_from_t1(patient)
+
+    written = []
+    for name, mesh in meshes.items():
+        if mesh is None or mesh.n_points == 0:
+            continue
+        path = os.path.join(case_dir, f"{name}.vtp")
+        mesh.save(path)
+        written.append(os.path.relpath(path, out_dir))
+    return written
+
+def process_case(patient_id: str) -> Dict:
+    """
+    Volumetrics (and optionally meshes) of one case, run inside a pool worker.
+    The result is saved as cases/<id>.json, which marks the case as done.
+    """
+    loader, analyzer, out_dir = _worker["loader"], _worker["analyzer"], _worker["out_dir"]
+    t0 = time.perf_counter()
+    TRACER.clear()
+    try:
+        patient = loader.load_patient(patient_id)
+        if patient.mask is None:
+            raise ValueError("no segmentation mask")
+
+        stats = analyzer.compute_label_stats(patient)
+        row = {
+            "patient_id": patient_id,
+            "shape": "x".join(str(s) for s in patient.mask.shape),
+            "spacing": "x".join(f"{float(s):.3f}" for s in patient.spacing)
+        }
+        for lbl, name in LABEL_NAMES.items():
+            row[f"{name}_voxels"] = stats[lbl].voxel_count if lbl in stats else 0
+            row[f"{name}_cm3"] = round(stats[lbl].volume_cm3, 4) if lbl in stats else 0.0
+        row["tumor_cm3"] = round(sum(row[f"{name}_cm3"] for name in LABEL_NAMES.values()), 4)
+
+        if _worker["meshes"]:
+            row["meshes"] = ";".join(_export_meshes(analyzer, patient, out_dir, _worker["brain"]))
+
+        row["seconds"] = round(time.perf_counter() - t0, 3)
+        if _worker["trace"]:
+            TRACER.export_chrome_trace(os.path.join(out_dir, TRACES_DIR, f"{patient_id}.json"))
+        _write_json(os.path.join(out_dir, CASES_DIR, f"{patient_id}.json"), row)
+        return {"patient_id": patient_id, "ok": True, "seconds": row["seconds"]}
+    except Exception as e:
+        return {"patient_id": patient_id, "ok": False, "error": str(e)}
+
+def completed_cases(out_dir: str) -> List[str]:
+    cases_dir = os.path.join(out_dir, CASES_DIR)
+    if not os.path.isdir(cases_dir):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(cases_dir) if name.endswith(".json"))
+
+def write_results(out_dir: str, fmt: str = "csv") -> Optional[str]:
+    """Collects every completed case into one table (volumes.csv or volumes.parquet)."""
+    rows = []
+    for patient_id in completed_cases(out_dir):
+        with open(os.path.join(out_dir, CASES_DIR, f"{patient_id}.json"), "r", encoding="utf-8") as f:
+            rows.append(json.load(f))
+    if not rows:
+        return None
+
+    columns = list(rows[0])
+    for row in rows[1:]:
+        columns += [c for c in row if c not in columns]
+
+    if fmt == "parquet":
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("Parquet output needs pandas and pyarrow (pip install pandas pyarrow)") from e
+        path = os.path.join(out_dir, f"{RESULTS_NAME}.parquet")
+        pd.DataFrame(rows, columns=columns).to_parquet(path, index=False)
+        return path
+
+    path = os.path.join(out_dir, f"{RESULTS_NAME}.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+def run_batch(root: str, out_dir: str, workers: Optional[int] = None, meshes: bool = False,
+              brain: bool = False, fmt: str = "csv", overwrite: bool = False,
+              patient_ids: Optional[List[str]] = None, trace: bool = False) -> Dict:
+    """
+    Processes a cohort on a process pool. Cases already in out_dir/cases are skipped
+    unless overwrite is set, so an interrupted run picks up where it stopped.
+    With trace, the stage spans of each case are saved as Chrome trace JSON in out_dir/traces.
+    """
+    os.makedirs(os.path.join(out_dir, CASES_DIR), exist_ok=True)
+    if trace:
+        os.makedirs(os.path.join(out_dir, TRACES_DIR), exist_ok=True)
+
+    # Refresh the index once here; the workers only read it. It is kept under out_dir,
+    # so the cohort root is never written to (a failed save only costs the next rescan).
+    index = CohortIndex(root, index_path=os.path.join(out_dir, DEFAULT_INDEX_NAME))
+    index.refresh()
+    if patient_ids is None:
+        patient_ids = index.patient_ids(require_seg=True)
+
+    done = set() if overwrite else set(completed_cases(out_dir))
+    todo = [pid for pid in patient_ids if pid not in done]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(todo) or 1))
+    print(f"Batch: {len(todo)} cases to process, {len(patient_ids) - len(todo)} already done, {workers} workers")
+
+    t0 = time.perf_counter()
+    failed = []
+    if todo:
+        with mp.Pool(workers, initializer=_init_worker, initargs=(root, out_dir, meshes, brain, trace)) as pool:
+            for n, result in enumerate(pool.imap_unordered(process_case, todo), start=1):
+                if result["ok"]:
+                    print(f"[{n}/{len(todo)}] {result['patient_id']} ({result['seconds']:.1f}s)")
+                else:
+                    failed.append(result)
+                    print(f"[{n}/{len(todo)}] {result['patient_id']} FAILED: {result['error']}")
+
+    results_path = write_results(out_dir, fmt)
+    elapsed = time.perf_counter() - t0
+    print(f"Batch finished in {elapsed:.1f}s: {len(todo) - len(failed)} processed, {len(failed)} failed")
+    if results_path:
+        print(f"Results: {results_path}")
+    return {"processed": len(todo) - len(failed), "failed": failed, "results": results_path}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Headless neurovoxel tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="Label volumes (and meshes) of a whole cohort")
+    batch.add_argument("--root", required=True, help="BraTS root folder (one folder per patient)")
+    batch.add_argument("--out", required=True, help="Output folder")
+    batch.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    batch.add_argument("--meshes", action="store_true", help="Export label meshes (.vtp) per case")
+    batch.add_argument("--brain", action="store_true", help="With --meshes, also export the T1 brain shell")
+    batch.add_argument("--format", choices=("csv", "parquet"), default="csv", help="Results table format")
+    batch.add_argument("--overwrite", action="store_true", help="Re-process cases that are already done")
+    batch.add_argument("--cases", nargs="+", default=None, help="Only these case ids")
+    batch.add_argument("--trace", action="store_true", help="Save per-case stage timings as Chrome trace JSON")
+
+    args = parser.parse_args(argv)
+    if args.command == "batch":
+        # Checked up front: the table is only written once every case has been processed
+        if args.format == "parquet":
+            try:
+                import pandas
+                import pyarrow
+            except ImportError:
+                batch.error("--format parquet needs pandas and pyarrow (pip install pandas pyarrow)")
+        summary = run_batch(args.root, args.out, args.workers, args.meshes, args.brain,
+                            args.format, args.overwrite, args.cases, args.trace)
+        return 1 if summary["failed"] else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,48 +1,469 @@
 import numpy as np
 import pyvista as pv
-from src.core.structure import PatientVolume
+from typing import Dict, List, Optional, Tuple
+from vtkmodules.vtkFiltersCore import vtkStaticCleanPolyData
+from vtkmodules.vtkFiltersGeneral import vtkDiscreteMarchingCubes
+from src.core.structure import PatientVolume, LabelStats
+from src.core.mesh_cache import MeshCache
+from src.core.mask_diff import MaskDiff, diff_masks, surface_counts
+from src.core.tracing import span
+
+# Meshing parameters (also part of the mesh cache key)
+LABEL_ISO = 0.5
+LABEL_SMOOTH_ITER = 100
+BRAIN_ISO = 10
+BRAIN_SMOOTH_ITER = 50
+
+# Incremental re-meshing: changed bricks are grown by SPLICE_MARGIN voxels into the box
+# that is re-contoured, with SPLICE_HALO voxels of context for smoothing. A change box
+# larger than SPLICE_MAX_FRACTION of the label's region is re-meshed from scratch.
+SPLICE_MARGIN = 2
+SPLICE_HALO = 6
+SPLICE_MAX_FRACTION = 0.5
+# Distance (in voxels) under which vertices on either side of a cut are welded
+SPLICE_WELD_TOLERANCE = 0.01
+
+# Triangle budgets of the level-of-detail chain, finest first.
+# None keeps the full-resolution surface as the finest level.
+LOD_TRIANGLE_BUDGETS = (None, 50_000)
+
+def decimate_to_budget(mesh: pv.PolyData, budget: int) -> pv.PolyData:
+    """Quadric decimation of a triangle mesh down to about `budget` triangles."""
+    if mesh.n_cells <= budget:
+        return mesh
+    return mesh.decimate(1.0 - budget / mesh.n_cells)
+
+def _box_size(box: Tuple[slice, ...]) -> int:
+    return int(np.prod([b.stop - b.start for b in box]))
+
+def _cells_in_box(mesh: pv.PolyData, box: Tuple[slice, ...], spacing, origin) -> np.ndarray:
+    """
+    Cells whose marching-cubes cube lies entirely inside the voxel box. Cube i spans
+    voxels i and i + 1, so it is inside when start <= i < stop - 1 on every axis.
+    """
+    centers = np.asarray(mesh.cell_centers().points)
+    cubes = np.floor((centers - np.asarray(origin)) / np.asarray(spacing, dtype=float)).astype(np.intp)
+    start = np.array([b.start for b in box])
+    stop = np.array([b.stop for b in box])
+    return np.all((cubes >= start) & (cubes < stop - 1), axis=1)
 
 class VolumeAnalyzer:
+    def __init__(self, mesh_cache: Optional[MeshCache] = None,
+                 lod_budgets: Tuple[Optional[int], ...] = LOD_TRIANGLE_BUDGETS):
+        # Optional persistent mesh cache; cache hits skip contouring and smoothing entirely
+        self.mesh_cache = mesh_cache
+        # Triangle budgets of get_lods, finest first
+        self.lod_budgets = tuple(lod_budgets)
+
+    def _cache_key(self, patient: PatientVolume, source: np.ndarray, **params) -> Optional[str]:
+        if self.mesh_cache is None:
+            return None
+        spacing = tuple(float(sp) for sp in patient.spacing)
+        if any(patient.origin):
+            params['origin'] = tuple(float(o) for o in patient.origin)
+        return self.mesh_cache.make_key(source, spacing=spacing, **params)
+
+    def _cache_get(self, key: Optional[str]) -> Optional[pv.PolyData]:
+        if key is None:
+            return None
+        return self.mesh_cache.get(key)
+
+    def _cache_put(self, key: Optional[str], mesh: Optional[pv.PolyData]):
+        if key is not None and mesh is not None and mesh.n_points > 0:
+            self.mesh_cache.put(key, mesh)
+
+    def compute_label_stats(self, patient: PatientVolume, refresh: bool = False) -> Dict[int, LabelStats]:
+        """
+        It computes voxel count, volume (cm³), bounding box, centroid and surface voxel
+        count for every label of the mask in a single pass over the volume.
+        The result is cached on the patient (patient.label_stats), so later calls are free.
+        Pass refresh=True after replacing patient.mask.
+        """
+        if patient.mask is None:
+            return {}
+
+        if patient.label_stats is not None and not refresh:
+            return patient.label_stats
+
+        with span("stats", case=patient.id):
+            patient.label_stats = self._scan_label_stats(patient)
+        return patient.label_stats
+
+    def _scan_label_stats(self, patient: PatientVolume) -> Dict[int, LabelStats]:
+        mask = patient.mask
+        n_labels = int(mask.max()) + 1
+        nx, ny, nz = mask.shape
+
+        # Per-axis label profiles: profile[i, l] = voxels of label l in plane i.
+        # Counts, bounding boxes and centroids are all derived from these.
+        profile_x = np.zeros((nx, n_labels), dtype=np.int64)
+        profile_y = np.zeros((ny, n_labels), dtype=np.int64)
+        profile_z = np.zeros((nz, n_labels), dtype=np.int64)
+        surface = np.zeros(n_labels, dtype=np.int64)
+
+        row_keys = np.arange(ny, dtype=np.intp)[:, None] * n_labels
+        col_keys = np.arange(nz, dtype=np.intp)[None, :] * n_labels
+
+        # Walk the volume slab by slab so temporaries stay slice-sized
+        for i in range(nx):
+            sl = mask[i].astype(np.intp)
+
+            profile_x[i] = np.bincount(sl.ravel(), minlength=n_labels)
+            profile_y += np.bincount((sl + row_keys).ravel(), minlength=ny * n_labels).reshape(ny, n_labels)
+            profile_z += np.bincount((sl + col_keys).ravel(), minlength=nz * n_labels).reshape(nz, n_labels)
+
+            # Surface voxels: any 6-neighbour carries a different label.
+            # Everything outside the volume counts as background (0).
+            edge = np.zeros(sl.shape, dtype=bool)
+            diff = sl[1:, :] != sl[:-1, :]
+            edge[1:, :] |= diff
+            edge[:-1, :] |= diff
+            diff = sl[:, 1:] != sl[:, :-1]
+            edge[:, 1:] |= diff
+            edge[:, :-1] |= diff
+
+            border = np.zeros(sl.shape, dtype=bool)
+            border[[0, -1], :] = True
+            border[:, [0, -1]] = True
+            if i == 0 or i == nx - 1:
+                border[:] = True
+            edge |= border & (sl != 0)
+
+            if i > 0:
+                edge |= mask[i] != mask[i - 1]
+            if i < nx - 1:
+                edge |= mask[i] != mask[i + 1]
+
+            surface += np.bincount(sl[edge], minlength=n_labels)
+
+        one_voxel_vol = (patient.spacing[0] *
+                         patient.spacing[1] *
+                         patient.spacing[2])
+
+        stats = {}
+        profiles = (profile_x, profile_y, profile_z)
+        for label in range(n_labels):
+            voxel_count = int(profile_x[:, label].sum())
+            if voxel_count == 0:
+                continue
+
+            bbox = []
+            centroid = []
+            for prof in profiles:
+                present = np.flatnonzero(prof[:, label])
+                bbox.append((int(present[0]), int(present[-1]) + 1))
+                centroid.append(float(np.arange(len(prof)) @ prof[:, label]) / voxel_count)
+
+            stats[label] = LabelStats(
+                label=label,
+                voxel_count=voxel_count,
+                volume_cm3=float(voxel_count * one_voxel_vol) / 1000.0,
+                bbox=tuple(bbox),
+                centroid=tuple(centroid),
+                surface_voxels=int(surface[label])
+            )
+
+        return stats
+
+    def update_label_stats(self, previous: PatientVolume, patient: PatientVolume,
+                           diff: Optional[MaskDiff] = None) -> Dict[int, LabelStats]:
+        """
+        Statistics of patient.mask derived from those of previous.mask and the difference
+        of the two masks, instead of a full pass: counts, volumes and centroids come from
+        the diff totals, surface voxels are recounted around the changed voxels only, and
+        a bounding box is rescanned (inside the old box) only when voxels were removed on its faces.
+        The result is cached on the patient like compute_label_stats.
+        """
+        if patient.mask is None:
+            return {}
+        if previous.mask is None or previous.mask.shape != patient.mask.shape:
+            return self.compute_label_stats(patient, refresh=True)
+
+        old_stats = self.compute_label_stats(previous)
+        if diff is None:
+            diff = diff_masks(previous.mask, patient.mask)
+        if diff.empty:
+            patient.label_stats = dict(old_stats)
+            return patient.label_stats
+
+        with span("stats", case=patient.id, incremental=True):
+            patient.label_stats = self._diff_label_stats(old_stats, previous, patient, diff)
+        return patient.label_stats
+
+    def _diff_label_stats(self, old_stats: Dict[int, LabelStats], previous: PatientVolume,
+                          patient: PatientVolume, diff: MaskDiff) -> Dict[int, LabelStats]:
+        n_labels = max(max(old_stats, default=0), max(diff.label_delta)) + 1
+        # A voxel's surface status can only change next to a changed voxel
+        box = tuple(slice(max(start - 1, 0), min(stop + 1, size))
+                    for (start, stop), size in zip(diff.bbox, patient.mask.shape))
+        surface_delta = surface_counts(patient.mask, box, n_labels) - surface_counts(previous.mask, box, n_labels)
+
+        one_voxel_vol = (patient.spacing[0] *
+                         patient.spacing[1] *
+                         patient.spacing[2])
+
+        stats = {}
+        for label in sorted(set(old_stats) | set(diff.label_delta)):
+            old = old_stats.get(label)
+            if label not in diff.label_delta:
+                stats[label] = old
+                continue
+
+            old_count = old.voxel_count if old is not None else 0
+            voxel_count = old_count + diff.label_delta[label]
+            if voxel_count == 0:
+                continue
+
+            coord_sum = diff.coord_delta[label].astype(np.float64)
+            if old is not None:
+                coord_sum += np.asarray(old.centroid) * old_count
+
+            stats[label] = LabelStats(
+                label=label,
+                voxel_count=voxel_count,
+                volume_cm3=float(voxel_count * one_voxel_vol) / 1000.0,
+                bbox=self._updated_bbox(patient.mask, label, old, diff),
+                centroid=tuple(float(c) for c in coord_sum / voxel_count),
+                surface_voxels=(old.surface_voxels if old is not None else 0) + int(surface_delta[label])
+            )
+
+        return stats
+
+    def _updated_bbox(self, mask: np.ndarray, label: int, old: Optional[LabelStats],
+                      diff: MaskDiff) -> Tuple[Tuple[int, int], ...]:
+        if old is None:
+            # Every voxel of a new label was added
+            return diff.added_bbox[label]
+
+        bbox = old.bbox
+        added = diff.added_bbox.get(label)
+        if added is not None:
+            bbox = tuple((min(b[0], a[0]), max(b[1], a[1])) for b, a in zip(bbox, added))
+
+        # Removals can only shrink the box if they reach one of its faces
+        removed = diff.removed_bbox.get(label)
+        if removed is None or not any(r[0] == b[0] or r[1] == b[1] for r, b in zip(removed, bbox)):
+            return bbox
+
+        present = mask[tuple(slice(start, stop) for start, stop in bbox)] == label
+        shrunk = []
+        for axis, (start, _) in enumerate(bbox):
+            other = tuple(a for a in range(3) if a != axis)
+            hits = np.flatnonzero(present.any(axis=other))
+            shrunk.append((start + int(hits[0]), start + int(hits[-1]) + 1))
+        return tuple(shrunk)
+
     def calculate_volume(self, patient: PatientVolume, label_idx: int) -> float:
         """
         It calculates the volume of a specific label (tumour piece) in cm³
         Formula: Voxel number * Voxel volume / 1000
+        Reads the cached single-pass statistics instead of rescanning the mask.
         """
         if patient.mask is None:
             return 0.0
-        
-        voxel_count = np.sum(patient.mask == label_idx)
 
-        one_voxel_vol = (patient.spacing[0] *
-                         patient.spacing[1] *
-                         patient.spacing[2])
-        
-        total_vol = voxel_count * one_voxel_vol
+        stats = self.compute_label_stats(patient)
+        if label_idx not in stats:
+            return 0.0
 
-        return total_vol / 1000.0
+        return stats[label_idx].volume_cm3
     
-    def get_mesh_from_mask(self, patient: PatientVolume, label_idx: int):
+    def _padded_roi(self, stats: List[LabelStats], shape, padding: int) -> Tuple[slice, ...]:
+        """
+        Union of the bounding boxes of the given labels, grown by `padding` voxels
+        and clipped to the volume. The padding keeps surfaces closed after cropping.
+        """
+        roi = []
+        for axis in range(3):
+            start = min(s.bbox[axis][0] for s in stats)
+            stop = max(s.bbox[axis][1] for s in stats)
+            roi.append(slice(max(start - padding, 0), min(stop + padding, shape[axis])))
+        return tuple(roi)
+
+    def _wrap_roi(self, data: np.ndarray, roi: Tuple[slice, ...], spacing,
+                  origin=(0.0, 0.0, 0.0)) -> pv.ImageData:
+        """
+        Wraps a cropped array as a grid placed at its position inside the full volume.
+        """
+        grid = pv.wrap(np.ascontiguousarray(data))
+        grid.spacing = spacing
+        grid.origin = tuple(o + r.start * sp for o, r, sp in zip(origin, roi, spacing))
+        return grid
+
+    def get_mesh_from_mask(self, patient: PatientVolume, label_idx: int, padding: int = 2):
         """
         It produces a 3d mesh -surface- from the mask using the marching cubes or contour algorithms.
+        Only the bounding box of the label (plus padding) is contoured, not the whole volume.
         """
         if patient.mask is None:
             return None
-        
-        binary_mask = np.where(patient.mask == label_idx, 1, 0)
 
-        grid = pv.wrap(binary_mask)
+        # Skip labels that are absent instead of contouring an empty volume
+        stats = self.compute_label_stats(patient)
+        if label_idx not in stats:
+            return None
 
-        grid.spacing = patient.spacing
+        key = self._cache_key(patient, patient.mask, kind='label', label=label_idx,
+                              iso=LABEL_ISO, n_iter=LABEL_SMOOTH_ITER)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        roi = self._padded_roi([stats[label_idx]], patient.mask.shape, padding)
+        binary_mask = (patient.mask[roi] == label_idx).astype(np.uint8)
+
+        grid = self._wrap_roi(binary_mask, roi, patient.spacing, patient.origin)
 
         try:
-            mesh = grid.contour(isosurfaces=[0.5])
-            mesh = mesh.smooth(n_iter=100)
-            
+            with span("contour", case=patient.id, label=label_idx):
+                mesh = grid.contour(isosurfaces=[LABEL_ISO])
+            with span("smooth", case=patient.id, label=label_idx):
+                mesh = mesh.smooth(n_iter=LABEL_SMOOTH_ITER)
+
+            self._cache_put(key, mesh)
             return mesh
         except Exception as e:
             print(f"Mash could not be created (Label {label_idx} may be missing): {e}")
             return None
 
+    def update_mesh_from_mask(self, previous: PatientVolume, patient: PatientVolume, label_idx: int,
+                              mesh: Optional[pv.PolyData], diff: Optional[MaskDiff] = None,
+                              padding: int = 2) -> Optional[pv.PolyData]:
+        """
+        Surface of a label after a mask change. `mesh` is the label's surface on previous.mask:
+        only the bricks where the label changed are re-contoured, and the new patch replaces
+        the cells of `mesh` inside them. Unchanged labels return `mesh` as is.
+        Falls back to get_mesh_from_mask when there is no surface to splice into or the
+        change covers most of the label.
+        """
+        if patient.mask is None:
+            return None
+        stats = self.compute_label_stats(patient)
+        if label_idx not in stats:
+            return None
+        if diff is None:
+            diff = diff_masks(previous.mask, patient.mask)
+
+        boxes = diff.label_boxes(label_idx, margin=SPLICE_MARGIN)
+        if not boxes and mesh is not None:
+            return mesh
+        roi = self._padded_roi([stats[label_idx]], patient.mask.shape, padding)
+        if (mesh is None or mesh.n_cells == 0 or
+                sum(_box_size(box) for box in boxes) > SPLICE_MAX_FRACTION * _box_size(roi)):
+            return self.get_mesh_from_mask(patient, label_idx, padding)
+
+        # A full re-mesh of this mask, if one was ever built, is the reference surface
+        cached = self._cache_get(self._cache_key(patient, patient.mask, kind='label', label=label_idx,
+                                                 iso=LABEL_ISO, n_iter=LABEL_SMOOTH_ITER))
+        if cached is not None:
+            return cached
+        # Splices are only welded to a tolerance: cached apart from the reference meshes,
+        # keyed by the mask they were spliced from as well
+        key = None
+        if self.mesh_cache is not None:
+            key = self._cache_key(patient, patient.mask, kind='label_splice', label=label_idx,
+                                  iso=LABEL_ISO, n_iter=LABEL_SMOOTH_ITER,
+                                  previous=self.mesh_cache.digest(previous.mask))
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            for box in boxes:
+                mesh = self._splice_box(patient, label_idx, mesh, box)
+            # Patch and surface vertices on the cut agree to well below a voxel: weld them
+            clean = vtkStaticCleanPolyData()
+            clean.SetInputData(mesh)
+            clean.SetToleranceIsAbsolute(True)
+            clean.SetAbsoluteTolerance(SPLICE_WELD_TOLERANCE * min(patient.spacing))
+            clean.Update()
+            mesh = pv.wrap(clean.GetOutput())
+            self._cache_put(key, mesh)
+            return mesh
+        except Exception as e:
+            print(f"Mesh splice failed (Label {label_idx}), re-meshing: {e}")
+            return self.get_mesh_from_mask(patient, label_idx, padding)
+
+    def _splice_box(self, patient: PatientVolume, label_idx: int, mesh: pv.PolyData,
+                    box: Tuple[slice, ...]) -> pv.PolyData:
+        """Replaces the cells of `mesh` inside a voxel box with a freshly contoured patch."""
+        # Patch: the box plus a halo of context, so smoothing near the cut matches the rest
+        halo = tuple(slice(max(b.start - SPLICE_HALO, 0), min(b.stop + SPLICE_HALO, s))
+                     for b, s in zip(box, patient.mask.shape))
+        binary_mask = (patient.mask[halo] == label_idx).astype(np.uint8)
+        grid = self._wrap_roi(binary_mask, halo, patient.spacing, patient.origin)
+
+        with span("contour", case=patient.id, label=label_idx, splice=True):
+            patch = grid.contour(isosurfaces=[LABEL_ISO])
+        parts = []
+        if patch.n_cells > 0:
+            # Both sides of the cut are decided on smoothed positions: near the cut the
+            # patch (smoothed with its halo) and the old surface agree, so the cells match up
+            with span("smooth", case=patient.id, label=label_idx, splice=True):
+                patch = patch.smooth(n_iter=LABEL_SMOOTH_ITER)
+            in_box = _cells_in_box(patch, box, patient.spacing, patient.origin)
+            if in_box.any():
+                parts.append(patch.remove_cells(~in_box))
+
+        kept = mesh.remove_cells(_cells_in_box(mesh, box, patient.spacing, patient.origin))
+        if kept.n_cells > 0:
+            parts.insert(0, kept)
+        return pv.merge(parts) if parts else pv.PolyData()
+
+    def get_meshes_from_mask(self, patient: PatientVolume, labels=(1, 2, 4),
+                             padding: int = 2) -> Dict[int, pv.PolyData]:
+        """
+        Extracts the surfaces of all requested labels in one sweep with discrete marching cubes.
+        The sweep runs over the union bounding box of the labels only.
+        Returns {label: mesh}; labels absent from the mask are left out.
+        """
+        if patient.mask is None:
+            return {}
+
+        stats = self.compute_label_stats(patient)
+        present = [label for label in labels if label in stats]
+
+        meshes = {}
+        keys = {}
+        for label in list(present):
+            keys[label] = self._cache_key(patient, patient.mask, kind='discrete', label=label,
+                                          n_iter=LABEL_SMOOTH_ITER)
+            cached = self._cache_get(keys[label])
+            if cached is not None:
+                meshes[label] = cached
+                present.remove(label)
+
+        # Only labels that missed the cache are contoured
+        if not present:
+            return meshes
+
+        roi = self._padded_roi([stats[label] for label in present], patient.mask.shape, padding)
+        grid = self._wrap_roi(patient.mask[roi], roi, patient.spacing, patient.origin)
+
+        try:
+            with span("contour", case=patient.id, labels=list(present)):
+                dmc = vtkDiscreteMarchingCubes()
+                dmc.SetInputData(grid)
+                for i, label in enumerate(present):
+                    dmc.SetValue(i, label)
+                dmc.Update()
+                surface = pv.wrap(dmc.GetOutput())
+
+            # Each output cell carries the label it was extracted for
+            cell_labels = np.asarray(surface.cell_data['Scalars'])
+            for label in present:
+                keep = cell_labels == label
+                if not keep.any():
+                    continue
+                mesh = surface.remove_cells(~keep).clean()
+                with span("smooth", case=patient.id, label=label):
+                    meshes[label] = mesh.smooth(n_iter=LABEL_SMOOTH_ITER)
+                self._cache_put(keys[label], meshes[label])
+        except Exception as e:
+            print(f"Multi-label meshing failed: {e}")
+
+        return meshes
+
     def get_brain_mesh_from_t1(self, patient: PatientVolume) -> pv.PolyData | None:
         """
         Generates a mesh of the brain surface using the T1 modality.
@@ -52,17 +473,68 @@ class VolumeAnalyzer:
             return None
         
         t1_data = patient.modalities['t1']
+
+        key = self._cache_key(patient, t1_data, kind='brain', iso=BRAIN_ISO, n_iter=BRAIN_SMOOTH_ITER)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
         
         # Simple thresholding: Assume brain tissue > 0 (background is usually 0)
         # We assume background is black (0).
         grid = pv.wrap(t1_data)
         grid.spacing = patient.spacing
+        grid.origin = patient.origin
         
         try:
             # Contour at a low value (e.g., 10) to capture the outer skull/brain surface
-            mesh = grid.contour(isosurfaces=[10])
-            mesh = mesh.smooth(n_iter=50)
+            with span("contour", case=patient.id, label="brain"):
+                mesh = grid.contour(isosurfaces=[BRAIN_ISO])
+            with span("smooth", case=patient.id, label="brain"):
+                mesh = mesh.smooth(n_iter=BRAIN_SMOOTH_ITER)
+            self._cache_put(key, mesh)
             return mesh
         except Exception as e:
             print(f"Error generating brain surface: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def get_lods(self, patient: PatientVolume, label_idx: Optional[int],
+                 mesh: Optional[pv.PolyData] = None,
+                 previous: Optional[PatientVolume] = None) -> List[pv.PolyData]:
+        """
+        Level-of-detail chain of one surface (a mask label, or the T1 brain shell for None),
+        finest first: each level is the previous one decimated to its triangle budget.
+        Levels the surface already fits are left out. Pass `mesh` if the
+        full-resolution surface has been built already. Empty list if there is no surface.
+        Pass `previous` when `mesh` came from update_mesh_from_mask: levels decimated from
+        a splice are cached apart from those of a full re-mesh of the same mask.
+        """
+        if label_idx is None:
+            source = patient.modalities['t1'] if 't1' in patient.modalities else None
+            base = dict(base='brain', iso=BRAIN_ISO, n_iter=BRAIN_SMOOTH_ITER)
+            if mesh is None:
+                mesh = self.get_brain_mesh_from_t1(patient)
+        else:
+            source = patient.mask
+            base = dict(base='label', label=label_idx, iso=LABEL_ISO, n_iter=LABEL_SMOOTH_ITER)
+            if previous is not None and self.mesh_cache is not None:
+                base.update(base='label_splice', previous=self.mesh_cache.digest(previous.mask))
+            if mesh is None:
+                mesh = self.get_mesh_from_mask(patient, label_idx)
+
+        if mesh is None or mesh.n_cells == 0:
+            return []
+
+        lods = []
+        current = mesh
+        for budget in self.lod_budgets:
+            if budget is not None and current.n_cells > budget:
+                key = self._cache_key(patient, source, kind='lod', budget=budget, **base)
+                decimated = self._cache_get(key)
+                if decimated is None:
+                    with span("decimate", case=patient.id, label=label_idx, budget=budget):
+                        decimated = decimate_to_budget(current, budget)
+                    self._cache_put(key, decimated)
+                current = decimated
+            if not lods or current is not lods[-1]:
+                lods.append(current)
+        return lods
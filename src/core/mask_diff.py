@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Edge length (voxels) of the bricks changes are tracked in
+BRICK_SIZE = 16
+
+@dataclass
+class MaskDiff:
+    """
+    Voxel-level difference between two masks of the same case, produced by diff_masks.
+    Everything except the comparison itself is proportional to the number of changed voxels.
+    """
+    shape: Tuple[int, int, int]                 #Mask shape
+    brick_size: int                             #Brick edge length in voxels
+    changed_voxels: int                         #Voxels whose label changed
+    label_delta: Dict[int, int] = field(default_factory=dict)   #Label -> voxels gained (negative: lost)
+    coord_delta: Dict[int, np.ndarray] = field(default_factory=dict, repr=False)  #Label -> coordinate sum gained (x, y, z)
+    label_bricks: Dict[int, np.ndarray] = field(default_factory=dict, repr=False) #Label -> (n, 3) bricks where it was added or removed
+    removed_bbox: Dict[int, Tuple[Tuple[int, int], ...]] = field(default_factory=dict, repr=False) #Label -> bbox of its removed voxels
+    added_bbox: Dict[int, Tuple[Tuple[int, int], ...]] = field(default_factory=dict, repr=False)   #Label -> bbox of its added voxels
+    bbox: Optional[Tuple[Tuple[int, int], ...]] = None  #Bounding box of all changed voxels (stop exclusive)
+
+    @property
+    def empty(self) -> bool:
+        return self.changed_voxels == 0
+
+    @property
+    def changed_labels(self):
+        return set(self.label_bricks)
+
+    def label_boxes(self, label: int, margin: int = 0) -> List[Tuple[slice, ...]]:
+        """
+        Boxes covering the bricks a label changed in, each brick grown by `margin` voxels
+        and clipped to the volume. Overlapping boxes are merged, so separate edits
+        give separate boxes. Empty if the label did not change.
+        """
+        bricks = self.label_bricks.get(label)
+        if bricks is None:
+            return []
+
+        boxes = [(np.maximum(b * self.brick_size - margin, 0),
+                  np.minimum((b + 1) * self.brick_size + margin, self.shape)) for b in bricks]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    (lo_i, hi_i), (lo_j, hi_j) = boxes[i], boxes[j]
+                    if np.all(lo_i < hi_j) and np.all(lo_j < hi_i):
+                        boxes[i] = (np.minimum(lo_i, lo_j), np.maximum(hi_i, hi_j))
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [tuple(slice(int(l), int(h)) for l, h in zip(lo, hi)) for lo, hi in boxes]
+
+def _bbox(coords: np.ndarray) -> Tuple[Tuple[int, int], ...]:
+    return tuple((int(lo), int(hi) + 1) for lo, hi in zip(coords.min(axis=0), coords.max(axis=0)))
+
+def diff_masks(old: np.ndarray, new: np.ndarray, brick_size: int = BRICK_SIZE) -> MaskDiff:
+    """
+    Compares two masks and summarizes the change per label: voxel count and
+    coordinate-sum deltas (for volumes and centroids), bounding boxes of the added and
+    removed voxels (for bounding boxes), and the bricks touched (for re-meshing).
+    """
+    if old.shape != new.shape:
+        raise ValueError(f"Mask shapes differ: {old.shape} vs {new.shape}")
+
+    changed = old != new
+    diff = MaskDiff(shape=tuple(old.shape), brick_size=brick_size, changed_voxels=int(np.count_nonzero(changed)))
+    if diff.empty:
+        return diff
+
+    # Coordinates are only gathered inside the bounding box of the change
+    bbox = []
+    for axis in range(3):
+        other = tuple(a for a in range(3) if a != axis)
+        hits = np.flatnonzero(changed.any(axis=other))
+        bbox.append((int(hits[0]), int(hits[-1]) + 1))
+    diff.bbox = tuple(bbox)
+    coords = np.argwhere(changed[tuple(slice(start, stop) for start, stop in bbox)])
+    coords += [start for start, _ in bbox]
+    index = tuple(coords.T)
+    old_labels = np.asarray(old[index], dtype=np.intp)
+    new_labels = np.asarray(new[index], dtype=np.intp)
+    bricks = coords // brick_size
+
+    for label in np.union1d(old_labels, new_labels):
+        removed = old_labels == label
+        added = new_labels == label
+        n_removed, n_added = int(removed.sum()), int(added.sum())
+
+        diff.label_delta[int(label)] = n_added - n_removed
+        diff.coord_delta[int(label)] = coords[added].sum(axis=0) - coords[removed].sum(axis=0)
+        diff.label_bricks[int(label)] = np.unique(bricks[removed | added], axis=0)
+        if n_removed:
+            diff.removed_bbox[int(label)] = _bbox(coords[removed])
+        if n_added:
+            diff.added_bbox[int(label)] = _bbox(coords[added])
+    return diff
+
+def surface_counts(mask: np.ndarray, box: Tuple[slice, ...], n_labels: int) -> np.ndarray:
+    """
+    Per-label count of surface voxels (a 6-neighbour carries another label, outside of
+    the volume counts as background) among the voxels inside `box`. Same definition as
+    VolumeAnalyzer.compute_label_stats, evaluated on the box plus a one-voxel halo only.
+    """
+    # Box plus halo, zero-padded where the halo leaves the volume
+    grown = tuple(slice(max(b.start - 1, 0), min(b.stop + 1, s)) for b, s in zip(box, mask.shape))
+    pad = [(b.start - g.start == 0, g.stop - b.stop == 0) for b, g in zip(box, grown)]
+    region = np.pad(mask[grown], [(int(lo), int(hi)) for lo, hi in pad])
+
+    inner = tuple(slice(1, -1) for _ in range(3))
+    core = region[inner]
+    edge = np.zeros(core.shape, dtype=bool)
+    for axis in range(3):
+        for shift in (-1, 1):
+            neighbour = [slice(1, -1)] * 3
+            neighbour[axis] = slice(1 + shift, region.shape[axis] - 1 + shift)
+            edge |= core != region[tuple(neighbour)]
+
+    return np.bincount(core[edge].astype(np.intp), minlength=n_labels)[:n_labels]
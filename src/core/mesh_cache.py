@@ -0,0 +1,123 @@
+import os
+import hashlib
+import threading
+import weakref
+import numpy as np
+from typing import TYPE_CHECKING, Optional
+
+# pyvista is imported on first read, so importing the cache (e.g. for DEFAULT_CACHE_DIR) stays light
+if TYPE_CHECKING:
+    import pyvista as pv
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "neurovoxel", "meshes")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class MeshCache:
+    """
+    Content-addressed on-disk cache of surface meshes.
+    Each mesh is stored as a binary .vtp file named after a hash of the source volume
+    and the meshing parameters. File modification time is the recency stamp:
+    hits touch the file, and the oldest files are evicted once the cache exceeds max_bytes.
+    Source arrays are treated as immutable; replace an array instead of editing it in place.
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # id(array) -> (weakref to array, digest). Avoids rehashing the same volume
+        # for every label of a case.
+        self._digests = {}
+
+    def digest(self, array: np.ndarray) -> str:
+        """Hash of an array's shape, dtype and content (memoized per array object)."""
+        with self._lock:
+            entry = self._digests.get(id(array))
+            if entry is not None and entry[0]() is array:
+                return entry[1]
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(str(array.shape).encode())
+        h.update(str(array.dtype).encode())
+        h.update(memoryview(np.ascontiguousarray(array)).cast('B'))
+        value = h.hexdigest()
+
+        with self._lock:
+            self._digests = {k: v for k, v in self._digests.items() if v[0]() is not None}
+            self._digests[id(array)] = (weakref.ref(array), value)
+        return value
+
+    def make_key(self, array: np.ndarray, **params) -> str:
+        """
+        Cache key for a mesh of `array` built with the given parameters
+        (e.g. kind, label, spacing, iso, n_iter).
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.digest(array).encode())
+        for name in sorted(params):
+            h.update(f"{name}={params[name]!r};".encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.vtp")
+
+    def get(self, key: str) -> Optional["pv.PolyData"]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        import pyvista as pv
+        try:
+            mesh = pv.read(path)
+            os.utime(path)  # mark as recently used
+            return mesh
+        except Exception as e:
+            print(f"Mesh cache entry unreadable, dropping it: {e}")
+            self._remove(path)
+            return None
+
+    def put(self, key: str, mesh: "pv.PolyData"):
+        path = self._path(key)
+        # Write under a temporary name first, so readers never see half-written files
+        tmp_path = os.path.join(self.cache_dir, f"tmp-{key}-{os.getpid()}-{threading.get_ident()}.vtp")
+        try:
+            mesh.save(tmp_path, binary=True)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Mesh could not be cached: {e}")
+            self._remove(tmp_path)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".vtp") or name.startswith("tmp-"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(os.path.join(self.cache_dir, name))
+                total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".vtp"):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
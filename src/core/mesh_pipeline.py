@@ -0,0 +1,162 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from src.core.analyzer import VolumeAnalyzer
+from src.core.structure import PatientVolume
+from src.core.pyramid import get_level
+from src.core.mask_diff import MaskDiff, diff_masks
+
+class MeshJob:
+    """
+    Handle for one patient's mesh build: one future per layer plus a shared cancel flag.
+    """
+    def __init__(self, total: int):
+        self.futures: Dict[str, Future] = {}
+        self.total = total
+        self.done = 0
+        # Layers whose full-resolution mesh was delivered; a late preview must not replace it
+        self.full_delivered = set()
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Cancels layers that have not started yet. Layers already running finish,
+        but their meshes are dropped instead of being delivered.
+        """
+        self._cancel_event.set()
+        for future in list(self.futures.values()):
+            future.cancel()
+
+    def _mark_done(self) -> int:
+        with self._lock:
+            self.done += 1
+            return self.done
+
+class MeshPipeline:
+    """
+    Builds the brain shell and tumor surfaces concurrently on a thread pool.
+    Threads (not processes) keep the meshes in-process, so no serialization is needed
+    before they reach the plotter.
+    """
+    def __init__(self, analyzer: VolumeAnalyzer, max_workers: Optional[int] = None):
+        self.analyzer = analyzer
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mesh")
+
+    def submit(self, patient: PatientVolume, layers: Dict[str, Optional[int]],
+               on_ready: Optional[Callable[[str, object], None]] = None,
+               on_progress: Optional[Callable[[int, int], None]] = None,
+               preview_factor: Optional[int] = None,
+               previous: Optional[PatientVolume] = None,
+               previous_meshes: Optional[Dict[str, object]] = None,
+               diff: Optional[MaskDiff] = None) -> MeshJob:
+        """
+        Schedules one task per layer. `layers` maps a layer key to a mask label,
+        or to None for the T1 brain shell.
+        on_ready(key, lods) receives the level-of-detail chain of a layer (finest first):
+        [full mesh] as soon as it is contoured, then the whole chain once decimated.
+        on_ready and on_progress(done, total) are called from worker threads.
+        With preview_factor (a pyramid level, e.g. 4) every layer is first meshed
+        from that coarse level and delivered as a quick preview, before the full mesh.
+        With `previous` (the same case before a mask change) and `previous_meshes`
+        ({key: full-resolution surface on previous.mask}), label layers are updated by
+        re-contouring only the changed bricks (see VolumeAnalyzer.update_mesh_from_mask).
+        `diff` is the mask difference, computed here if not given.
+        """
+        # Statistics drive the cropping of every label, compute them once up front
+        # instead of letting the tasks race to fill the cache.
+        self.analyzer.compute_label_stats(patient)
+
+        if previous is not None and diff is None:
+            diff = diff_masks(previous.mask, patient.mask)
+        update = (previous, previous_meshes or {}, diff) if previous is not None else None
+
+        job = MeshJob(total=len(layers))
+
+        # Previews are queued ahead of every full-resolution layer, so they all come first.
+        # The pyramid level is built by the first task (not on the caller's, i.e. the GUI,
+        # thread); it is queued before the preview tasks, which wait on it.
+        if preview_factor and on_ready is not None:
+            preview = self.executor.submit(self._preview_level, patient, preview_factor)
+            job.futures["preview_level"] = preview
+            for key, label_idx in layers.items():
+                job.futures[f"{key}:preview"] = self.executor.submit(
+                    self._build_preview, job, preview, key, label_idx, on_ready
+                )
+
+        for key, label_idx in layers.items():
+            job.futures[key] = self.executor.submit(
+                self._build_layer, job, patient, key, label_idx, on_ready, on_progress, update
+            )
+        return job
+
+    def _mesh(self, patient: PatientVolume, label_idx: Optional[int], key: Optional[str] = None, update=None):
+        if label_idx is None:
+            return self.analyzer.get_brain_mesh_from_t1(patient)
+        if update is not None:
+            previous, previous_meshes, diff = update
+            return self.analyzer.update_mesh_from_mask(previous, patient, label_idx,
+                                                       previous_meshes.get(key), diff)
+        return self.analyzer.get_mesh_from_mask(patient, label_idx)
+
+    def _preview_level(self, patient: PatientVolume, factor: int) -> PatientVolume:
+        preview = get_level(patient, factor)
+        self.analyzer.compute_label_stats(preview)
+        return preview
+
+    def _build_preview(self, job: MeshJob, preview: Future, key: str, label_idx: Optional[int],
+                       on_ready):
+        if job.cancelled:
+            return None
+
+        mesh = self._mesh(preview.result(), label_idx)
+        with job._lock:
+            if not job.cancelled and key not in job.full_delivered and mesh is not None and mesh.n_points > 0:
+                on_ready(key, [mesh])
+        return mesh
+
+    def _build_layer(self, job: MeshJob, patient: PatientVolume, key: str, label_idx: Optional[int],
+                     on_ready, on_progress, update=None):
+        if job.cancelled:
+            return None
+
+        mesh = None
+        lods = []
+        try:
+            mesh = self._mesh(patient, label_idx, key, update)
+
+            # The full-resolution surface is shown first; the decimated
+            # levels follow as a second delivery once they are built.
+            if not job.cancelled and on_ready is not None and mesh is not None and mesh.n_points > 0:
+                with job._lock:
+                    job.full_delivered.add(key)
+                    on_ready(key, [mesh])
+                previous = update[0] if update is not None and label_idx is not None else None
+                lods = self.analyzer.get_lods(patient, label_idx, mesh, previous=previous)
+                # Delivered before the layer counts as done: once the job reaches its
+                # total, every layer's chain has been handed over
+                if not job.cancelled and len(lods) > 1:
+                    on_ready(key, lods)
+        except Exception as e:
+            # A failed layer still counts as done, so the job reaches its total
+            print(f"Meshing of layer '{key}' failed: {e}")
+        finally:
+            done = job._mark_done()
+
+        if job.cancelled:
+            return None
+
+        if on_progress is not None:
+            on_progress(done, job.total)
+
+        return mesh
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,109 @@
+import threading
+from typing import Mapping, Tuple
+import numpy as np
+from src.core.structure import PatientVolume
+from src.loaders.lazy_volume import LazyModalities
+
+# Downsampling factors of the pyramid levels, finest first
+PYRAMID_FACTORS = (2, 4)
+
+def _blocks(data: np.ndarray, factor: int) -> np.ndarray:
+    """
+    (d, h, w, factor**3) view of the factor-sized blocks of a 3D array. Axes that are
+    not a multiple of the factor are edge-padded, so border blocks stay representative.
+    """
+    pad = [(0, -s % factor) for s in data.shape]
+    if any(after for _, after in pad):
+        data = np.pad(data, pad, mode='edge')
+    d, h, w = (s // factor for s in data.shape)
+    blocks = np.ascontiguousarray(data).reshape(d, factor, h, factor, w, factor)
+    return blocks.transpose(0, 2, 4, 1, 3, 5).reshape(d, h, w, factor ** 3)
+
+def block_mean(data: np.ndarray, factor: int) -> np.ndarray:
+    """Intensity downsampling: mean of each factor³ block, float32."""
+    return _blocks(data, factor).mean(axis=-1, dtype=np.float32)
+
+def block_mode(labels: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Label downsampling: most frequent label of each factor³ block (ties go to the
+    lower label). One vectorized count per label present, instead of a per-block loop.
+    """
+    blocks = _blocks(labels, factor)
+    present = np.unique(labels)
+    counts = np.stack([(blocks == label).sum(axis=-1, dtype=np.int32) for label in present])
+    return present[np.argmax(counts, axis=0)].astype(labels.dtype)
+
+class DownsampledVolume:
+    """
+    One modality of a pyramid level, block-averaged from the full-resolution
+    modality on first access. Same interface as LazyVolume, so LazyModalities can wrap it.
+    """
+    def __init__(self, source: Mapping[str, np.ndarray], name: str, factor: int):
+        self.source = source
+        self.name = name
+        self.factor = factor
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._data is not None
+
+    def load(self) -> np.ndarray:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = block_mean(self.source[self.name], self.factor)
+        return self._data
+
+    def release(self):
+        with self._lock:
+            self._data = None
+
+def level_geometry(patient: PatientVolume, factor: int) -> Tuple[np.ndarray, tuple, tuple]:
+    """
+    Affine, spacing and origin of a level. A coarse voxel covers factor³ fine voxels,
+    so its center sits (factor - 1) / 2 fine voxels further along each axis.
+    """
+    spacing = tuple(float(sp) * factor for sp in patient.spacing)
+    shift = [(factor - 1) / 2.0] * 3
+
+    affine = None
+    if patient.affine is not None:
+        affine = np.array(patient.affine, dtype=float)
+        affine[:3, 3] += affine[:3, :3] @ shift
+        affine[:3, :3] *= factor
+
+    origin = tuple(o + s * sp for o, s, sp in zip(patient.origin, shift, patient.spacing))
+    return affine, spacing, origin
+
+def get_level(patient: PatientVolume, factor: int) -> PatientVolume:
+    """
+    Pyramid level of a case (factor 1 is the case itself), built on first request
+    and cached on patient.pyramid. The mask is block-mode downsampled right away;
+    modalities are block-averaged only when a consumer touches them.
+    """
+    if factor == 1:
+        return patient
+
+    level = patient.pyramid.get(factor)
+    if level is None:
+        affine, spacing, origin = level_geometry(patient, factor)
+        modalities = LazyModalities({
+            name: DownsampledVolume(patient.modalities, name, factor) for name in patient.modalities
+        })
+        mask = block_mode(np.asarray(patient.mask), factor) if patient.mask is not None else None
+        level = PatientVolume(
+            id=patient.id,
+            modalities=modalities,
+            mask=mask,
+            affine=affine,
+            spacing=spacing,
+            origin=origin
+        )
+        patient.pyramid[factor] = level
+    return level
+
+def build_pyramid(patient: PatientVolume, factors=PYRAMID_FACTORS):
+    """All levels of a case, coarsest first (the order previews are built in)."""
+    return [get_level(patient, factor) for factor in sorted(factors, reverse=True)]
@@ -0,0 +1,196 @@
+import mmap
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+from src.core.structure import PatientVolume
+from src.loaders.lazy_volume import LazyModalities
+
+DEFAULT_SESSION_CACHE_BYTES = 2 * 1024 ** 3
+# Modalities a prefetch decodes ahead of time (the brain shell is built from T1)
+PREFETCH_MODALITIES = ('t1',)
+
+def _root(array: np.ndarray):
+    """The object owning an array's memory (the array itself, a base array, or an mmap)."""
+    base = array
+    while isinstance(base, np.ndarray) and base.base is not None:
+        if isinstance(base, np.memmap):
+            return base
+        base = base.base
+    return base
+
+def _arrays(patient: PatientVolume) -> Iterable[np.ndarray]:
+    """Arrays held in memory by a case: mask, decoded modalities, stack and pyramid levels."""
+    modalities = patient.modalities
+    for name in modalities:
+        if isinstance(modalities, LazyModalities) and not modalities.is_loaded(name):
+            continue
+        yield modalities[name]
+    for array in (patient.mask, patient.stacked):
+        if array is not None:
+            yield array
+    for level in patient.pyramid.values():
+        yield from _arrays(level)
+
+def patient_nbytes(patient: PatientVolume) -> int:
+    """
+    RAM held by a case's arrays. Views are counted once through the array that owns
+    the memory, and memory-mapped files (page cache, not heap) are not counted.
+    """
+    roots = {}
+    for array in _arrays(patient):
+        array = np.asarray(array)
+        root = _root(array)
+        if isinstance(root, (np.memmap, mmap.mmap)):
+            continue
+        # Arrays over a foreign buffer (bytes, bytearray) count their own size
+        roots[id(root)] = root.nbytes if isinstance(root, np.ndarray) else array.nbytes
+    return sum(roots.values())
+
+def mesh_nbytes(meshes: Dict[str, List]) -> int:
+    """Bytes of the VTK buffers behind a set of LOD chains (GetActualMemorySize is in KiB)."""
+    return sum(mesh.GetActualMemorySize() * 1024 for lods in meshes.values() for mesh in lods)
+
+@dataclass
+class SessionEntry:
+    patient: PatientVolume              #Case as loaded (label stats cached on it)
+    meshes: Dict[str, List] = field(default_factory=dict, repr=False)  #Layer key -> LOD chain (finest first)
+    nbytes: int = 0                     #Arrays plus mesh buffers, as of the last size check
+
+class SessionCache:
+    """
+    Recently opened cases of a session, kept in RAM so switching back to one is instant.
+    Each entry holds the PatientVolume (with its label statistics and pyramid levels)
+    and the surface meshes built for it. Entries are evicted least recently used first
+    once arrays plus mesh buffers exceed max_bytes; the pinned case (the one on screen)
+    is never evicted. Sizes are re-measured on eviction, since lazy modalities, pyramid
+    levels and meshes are added to an entry after it was stored.
+    """
+    def __init__(self, loader, analyzer=None, max_bytes: int = DEFAULT_SESSION_CACHE_BYTES):
+        self.loader = loader
+        self.analyzer = analyzer
+        self.max_bytes = max_bytes
+        self.pinned = None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # patient_id -> Event set when a load in progress (e.g. a prefetch) finishes
+        self._loading = {}
+        self._prefetch_thread = None
+
+    def get(self, patient_id: str) -> Optional[SessionEntry]:
+        """Cached entry of a case (marked most recently used), or None."""
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is not None:
+                self._entries.move_to_end(patient_id)
+            return entry
+
+    def __contains__(self, patient_id) -> bool:
+        with self._lock:
+            return patient_id in self._entries
+
+    def load(self, patient_id: str, progress_callback: Optional[Callable[[int, int], None]] = None) -> PatientVolume:
+        """
+        The case from the cache, or loaded (with label statistics) and stored.
+        If another thread is already loading the same case, waits for its result.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(patient_id)
+                if entry is not None:
+                    self._entries.move_to_end(patient_id)
+                    return entry.patient
+                pending = self._loading.get(patient_id)
+                if pending is None:
+                    pending = self._loading[patient_id] = threading.Event()
+                    break
+            pending.wait()
+            # Loop: the other load may have failed (nothing stored), then we load ourselves
+
+        try:
+            patient = self.loader.load_patient(patient_id, progress_callback=progress_callback)
+            if self.analyzer is not None:
+                self.analyzer.compute_label_stats(patient)
+            self.put(patient)
+            return patient
+        finally:
+            with self._lock:
+                del self._loading[patient_id]
+            pending.set()
+
+    def put(self, patient: PatientVolume):
+        """Stores (or replaces) a case; meshes of a replaced entry are dropped."""
+        with self._lock:
+            self._entries[patient.id] = SessionEntry(patient)
+            self._entries.move_to_end(patient.id)
+            self._evict()
+
+    def put_meshes(self, patient: PatientVolume, meshes: Dict[str, List]):
+        """
+        Attaches the finished LOD chains of a case. Ignored unless `patient` is the cached
+        object itself: meshes of a derived case (an AI mask) must not replace its surfaces.
+        """
+        with self._lock:
+            entry = self._entries.get(patient.id)
+            if entry is None or entry.patient is not patient:
+                return
+            entry.meshes = {key: list(lods) for key, lods in meshes.items() if lods}
+            self._evict()
+
+    def discard(self, patient_id: str):
+        with self._lock:
+            self._entries.pop(patient_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def _evict(self):
+        # Caller holds the lock
+        total = 0
+        for entry in self._entries.values():
+            entry.nbytes = patient_nbytes(entry.patient) + mesh_nbytes(entry.meshes)
+            total += entry.nbytes
+        for patient_id in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if patient_id == self.pinned:
+                continue
+            total -= self._entries.pop(patient_id).nbytes
+            print(f"Session cache: evicted {patient_id} ({total / 2**20:.0f} MB kept)")
+
+    # --- prefetch ---
+
+    def prefetch(self, patient_id: str, modalities=PREFETCH_MODALITIES):
+        """
+        Loads a case into the cache on a background thread (one prefetch at a time;
+        a request while one runs is dropped). Also decodes `modalities`, so the first
+        view of the case does not wait on them.
+        """
+        if patient_id in self:
+            return
+        if self._prefetch_thread is not None and self._prefetch_thread.is_alive():
+            return
+        self._prefetch_thread = threading.Thread(
+            target=self._prefetch, args=(patient_id, modalities), name="session-prefetch", daemon=True
+        )
+        self._prefetch_thread.start()
+
+    def _prefetch(self, patient_id: str, modalities):
+        try:
+            patient = self.load(patient_id)
+            for name in modalities:
+                if name in patient.modalities:
+                    patient.modalities[name]
+            # Re-measure now that the modalities are decoded
+            with self._lock:
+                self._evict()
+        except Exception as e:
+            print(f"Prefetch of {patient_id} failed: {e}")
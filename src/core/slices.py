@@ -0,0 +1,183 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from src.core.structure import PatientVolume
+
+# Slicing axis of each orthogonal view (volumes are indexed x, y, z)
+VIEW_AXES = {'axial': 2, 'coronal': 1, 'sagittal': 0}
+# Default intensity window, as percentiles of the nonzero (brain) voxels
+WINDOW_PERCENTILES = (0.5, 99.5)
+DEFAULT_SLICE_CACHE_BYTES = 64 * 1024 * 1024
+
+def slice_view(volume: np.ndarray, view: str, index: int) -> np.ndarray:
+    """
+    2D slice of a volume in display orientation (superior / anterior at the top).
+    Basic indexing, a transpose and a flip: the result is a numpy view, no voxel is copied.
+    """
+    key = [slice(None)] * 3
+    key[VIEW_AXES[view]] = index
+    return volume[tuple(key)].T[::-1]
+
+def _in_plane(values, view: str) -> tuple:
+    """(row, column) entries of a per-axis triple (shape, spacing) for a view."""
+    rows, cols = [v for axis, v in enumerate(values) if axis != VIEW_AXES[view]][::-1]
+    return rows, cols
+
+def slice_spacing(spacing, view: str) -> Tuple[float, float]:
+    """(row, column) pixel spacing of a view, for aspect-correct display."""
+    rows, cols = _in_plane(spacing, view)
+    return float(rows), float(cols)
+
+def auto_window(volume: np.ndarray) -> Tuple[float, float]:
+    """Robust (low, high) intensity window, estimated on every other voxel of the brain."""
+    sample = volume[::2, ::2, ::2]
+    sample = sample[sample != 0]
+    if sample.size == 0:
+        return 0.0, 1.0
+    lo, hi = np.percentile(sample, WINDOW_PERCENTILES)
+    return float(lo), float(hi) if hi > lo else float(lo) + 1.0
+
+def window_lut(dtype, window: Tuple[float, float]) -> Optional[np.ndarray]:
+    """
+    uint8 gray lookup table of a window over every value of an 8/16-bit integer dtype.
+    Indexed with the raw bits of the data (see apply_window), so signed volumes need no
+    offset copy. Returns None for dtypes too wide for a table (floats, 32-bit ints).
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'iu' or dtype.itemsize > 2:
+        return None
+    unsigned = np.dtype(f'u{dtype.itemsize}')
+    values = np.arange(2 ** (8 * dtype.itemsize), dtype=unsigned).view(dtype)
+    return _window(values, window)
+
+def _window(values: np.ndarray, window: Tuple[float, float]) -> np.ndarray:
+    lo, hi = window
+    scaled = np.subtract(values, lo, dtype=np.float32)
+    scaled *= 255.0 / (hi - lo)
+    np.clip(scaled, 0, 255, out=scaled)
+    return scaled.astype(np.uint8)
+
+def apply_window(slice_2d: np.ndarray, window: Tuple[float, float], lut: Optional[np.ndarray] = None) -> np.ndarray:
+    """Window/level of a slice to uint8 gray: one table lookup when a LUT is given."""
+    if lut is not None:
+        unsigned = np.dtype(f'u{slice_2d.dtype.itemsize}')
+        return np.take(lut, slice_2d.view(unsigned))
+    return _window(slice_2d, window)
+
+def label_lut(labels: Dict[int, Tuple[Tuple[int, int, int], float]]) -> np.ndarray:
+    """
+    (256, 4) uint8 RGBA overlay table: label -> ((r, g, b), opacity).
+    Unlisted labels (and background) are fully transparent.
+    """
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    for label, (rgb, opacity) in labels.items():
+        lut[label, :3] = rgb
+        lut[label, 3] = int(round(255 * min(max(opacity, 0.0), 1.0)))
+    return lut
+
+def blend_table(overlay: np.ndarray) -> np.ndarray:
+    """
+    (65536, 3) uint8 table of every (label, gray) pair already alpha-blended, indexed
+    by label << 8 | gray. Built once per overlay, it turns blending into one lookup.
+    """
+    gray = np.arange(256, dtype=np.uint16)[None, :, None]
+    alpha = overlay[:, None, 3:].astype(np.uint16)
+    rgb = gray * (255 - alpha) + overlay[:, None, :3] * alpha
+    rgb += 127
+    rgb //= 255
+    return rgb.astype(np.uint8).reshape(-1, 3)
+
+def blend_overlay(gray: np.ndarray, labels_2d: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """Alpha-blends a label slice (labels 0-255) over a gray slice; contiguous (h, w, 3) uint8 RGB."""
+    index = labels_2d.astype(np.uint16)
+    index <<= 8
+    index |= gray
+    return np.take(table, index, axis=0)
+
+class SliceRenderer:
+    """
+    Orthogonal slices of one case as display-ready RGB images.
+    Slices are read as views of the modality and mask arrays; the window is applied
+    through a per-dtype lookup table and the labels through a (label, gray) blend table.
+    Rendered slices are kept in an LRU cache bounded by max_bytes, keyed by everything
+    that affects the pixels, so scrolling back over a stack costs a dictionary lookup.
+    """
+    def __init__(self, patient: PatientVolume, max_bytes: int = DEFAULT_SLICE_CACHE_BYTES):
+        self.patient = patient
+        self.max_bytes = max_bytes
+        self.modality = 't1' if 't1' in patient.modalities else next(iter(patient.modalities), None)
+        self.window = None
+        self.set_overlay({})
+
+        self._lut = None
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def volume(self) -> Optional[np.ndarray]:
+        return self.patient.modalities[self.modality] if self.modality is not None else None
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        if self.patient.mask is not None:
+            return self.patient.mask.shape
+        return self.volume.shape
+
+    def n_slices(self, view: str) -> int:
+        return self.shape[VIEW_AXES[view]]
+
+    def set_modality(self, modality: str):
+        if modality != self.modality:
+            self.modality = modality
+            self.window = None
+            self._lut = None
+
+    def set_window(self, window: Tuple[float, float]):
+        lo, hi = window
+        self.window = (float(lo), float(hi) if hi > lo else float(lo) + 1.0)
+        self._lut = None
+
+    def set_overlay(self, labels: Dict[int, Tuple[Tuple[int, int, int], float]]):
+        self.overlay = label_lut(labels)
+        self._overlay_key = self.overlay.tobytes()
+        self._blend = blend_table(self.overlay)
+
+    def render(self, view: str, index: int) -> np.ndarray:
+        """(h, w, 3) uint8 RGB of one slice. Treat as read-only: it may be served again from the cache."""
+        volume = self.volume
+        if self.window is None and volume is not None:
+            self.set_window(auto_window(volume))
+
+        key = (view, index, self.modality, self.window, self._overlay_key)
+        with self._lock:
+            image = self._cache.get(key)
+            if image is not None:
+                self._cache.move_to_end(key)
+                return image
+
+        if volume is not None:
+            if self._lut is None:
+                self._lut = window_lut(volume.dtype, self.window)
+            gray = apply_window(slice_view(volume, view, index), self.window, self._lut)
+        else:
+            gray = np.zeros(_in_plane(self.shape, view), dtype=np.uint8)
+
+        if self.patient.mask is not None:
+            image = blend_overlay(gray, slice_view(self.patient.mask, view, index), self._blend)
+        else:
+            image = np.repeat(gray[..., None], 3, axis=2)
+
+        with self._lock:
+            self._cache[key] = image
+            self._cache_bytes += image.nbytes
+            while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._cache_bytes -= old.nbytes
+        return image
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
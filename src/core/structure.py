@@ -1,17 +1,45 @@
-from dataclasses import dataclass
-from typing import Dict, Tuple, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Tuple, Optional
 import numpy as np
 
+# Channel order of the 4-modality model input
+MODALITIES = ('t1', 't1ce', 't2', 'flair')
+
+# Network class index -> BraTS label (background, necrotic core, edema, enhancing tumor)
+BRATS_LABELS = np.array([0, 1, 2, 4], dtype=np.uint8)
+
+@dataclass
+class LabelStats:
+    """
+    Per-label statistics of a segmentation mask, produced in a single pass
+    by VolumeAnalyzer.compute_label_stats.
+    """
+    label: int                          #Label value in the mask
+    voxel_count: int                    #Number of voxels with this label
+    volume_cm3: float                   #Physical volume (voxel count * voxel volume / 1000)
+    bbox: Tuple[Tuple[int, int], ...]   #Per axis (start, stop), stop is exclusive
+    centroid: Tuple[float, float, float]#Center of mass in voxel coordinates
+    surface_voxels: int                 #Voxels with at least one 6-neighbour of another label
+
+    @property
+    def bbox_slices(self) -> Tuple[slice, ...]:
+        """Bounding box as a tuple of slices, ready for array indexing."""
+        return tuple(slice(start, stop) for start, stop in self.bbox)
+
 @dataclass
 class PatientVolume:
     """"
     a dataclass that store all MRI data and metadata for a patient.
     """
     id: str                             #Patients ID 
-    modalities: Dict[str, np.ndarray]   #Image matrices
+    modalities: Mapping[str, np.ndarray]#Image matrices (dict, or LazyModalities in lazy mode)
     mask: Optional[np.ndarray]          #Segmentation mask(if available)
     affine: np.ndarray                  #Spatial position matrix (4*4)
     spacing: Tuple[float, float, float] #Voxel dimensions 
+    label_stats: Optional[Dict[int, LabelStats]] = field(default=None, repr=False) #Cached mask statistics
+    stacked: Optional[np.ndarray] = field(default=None, repr=False)  #(4, ...) modalities in MODALITIES order (volume store)
+    origin: Tuple[float, float, float] = (0.0, 0.0, 0.0)  #Mesh-space position of voxel (0, 0, 0)
+    pyramid: Dict[int, "PatientVolume"] = field(default_factory=dict, repr=False)  #Downsampled levels by factor (see core/pyramid.py)
 
 def __repr__(self): #represent for have a clear output look.
     mods = list(self.modalities.keys())
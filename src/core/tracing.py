@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Spans kept in memory; the oldest are dropped beyond this
+MAX_EVENTS = 100_000
+# NEUROVOXEL_TRACE_MEMORY=1 turns on tracemalloc at import (it slows allocations down noticeably)
+TRACE_MEMORY_ENV = "NEUROVOXEL_TRACE_MEMORY"
+
+def _max_rss_mb() -> Optional[float]:
+    """High-water mark of the process RSS (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+class _OpenSpan:
+    __slots__ = ("name", "args", "t_wall", "t_cpu", "rss", "mem", "peak")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.t_wall = time.perf_counter()
+        self.t_cpu = time.thread_time()
+        self.rss = _max_rss_mb()
+        self.mem = None
+        self.peak = 0
+
+class Tracer:
+    """
+    Collects timed spans of the pipeline stages (load, decode, stats, contour, smooth,
+    preprocess, forward, add_actor, render, ...). Each span records wall time, CPU time of its
+    thread, how far it pushed the process peak RSS, and, while tracemalloc is tracing,
+    the net and peak Python/numpy allocations inside it.
+    Spans nest per thread. tracemalloc is process-wide, so allocation figures of spans
+    running concurrently on several threads overlap.
+    """
+    def __init__(self, max_events: int = MAX_EVENTS):
+        self.enabled = True
+        self.events = deque(maxlen=max_events)
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # --- memory tracing ---
+
+    def start_memory(self):
+        """Starts tracemalloc, so spans also report allocations (costly, for diagnosis)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # --- spans ---
+
+    @contextmanager
+    def span(self, name: str, **args):
+        """Times the enclosed block as one span; `args` end up in the trace (e.g. case, label)."""
+        if not self.enabled:
+            yield
+            return
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        current = _OpenSpan(name, args)
+        if tracemalloc.is_tracing():
+            mem, peak = tracemalloc.get_traced_memory()
+            # The enclosing span keeps the peak reached so far; ours starts from here
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            current.mem = mem
+        stack.append(current)
+        try:
+            yield
+        finally:
+            stack.pop()
+            self._finish(current, stack)
+
+    def _finish(self, span: _OpenSpan, stack):
+        wall = time.perf_counter() - span.t_wall
+        event = {
+            "name": span.name,
+            "ts": span.t_wall - self._t0,
+            "wall_s": wall,
+            "cpu_s": time.thread_time() - span.t_cpu,
+            "thread": threading.current_thread().name,
+            "tid": threading.get_ident(),
+            "args": span.args
+        }
+
+        rss = _max_rss_mb()
+        if rss is not None and span.rss is not None:
+            event["rss_peak_delta_mb"] = rss - span.rss
+
+        if span.mem is not None and tracemalloc.is_tracing():
+            mem, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, span.peak)
+            event["alloc_delta_mb"] = (mem - span.mem) / 2**20
+            event["alloc_peak_mb"] = (peak - span.mem) / 2**20
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+
+        with self._lock:
+            self.events.append(event)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return list(self.events)
+
+    # --- export ---
+
+    def chrome_trace(self) -> Dict:
+        """Spans as Chrome trace events (chrome://tracing, Perfetto): one 'X' event per span."""
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for e in self.snapshot():
+            threads[e["tid"]] = e["thread"]
+            args = dict(e["args"])
+            args["cpu_ms"] = round(e["cpu_s"] * 1e3, 3)
+            for key in ("rss_peak_delta_mb", "alloc_delta_mb", "alloc_peak_mb"):
+                if key in e:
+                    args[key] = round(e[key], 3)
+            events.append({
+                "name": e["name"], "cat": "neurovoxel", "ph": "X",
+                "ts": round(e["ts"] * 1e6, 1), "dur": round(e["wall_s"] * 1e6, 1),
+                "pid": pid, "tid": e["tid"], "args": args
+            })
+        for tid, thread_name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": thread_name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> str:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+    def summary(self) -> List[Dict]:
+        """Per span name: count, total / mean / max wall time, total CPU time, worst memory figures."""
+        rows = {}
+        for e in self.snapshot():
+            row = rows.setdefault(e["name"], {"name": e["name"], "count": 0, "wall_s": 0.0, "max_s": 0.0,
+                                              "cpu_s": 0.0, "rss_peak_delta_mb": None, "alloc_peak_mb": None})
+            row["count"] += 1
+            row["wall_s"] += e["wall_s"]
+            row["max_s"] = max(row["max_s"], e["wall_s"])
+            row["cpu_s"] += e["cpu_s"]
+            for key in ("rss_peak_delta_mb", "alloc_peak_mb"):
+                if key in e:
+                    row[key] = max(row[key] or 0.0, e[key])
+        for row in rows.values():
+            row["mean_s"] = row["wall_s"] / row["count"]
+        return sorted(rows.values(), key=lambda r: r["wall_s"], reverse=True)
+
+    def format_summary(self) -> str:
+        lines = [f"{'stage':<14}{'n':>5}{'total (s)':>11}{'mean (s)':>10}{'max (s)':>9}{'cpu (s)':>9}"
+                 f"{'rss+ (MB)':>11}{'alloc (MB)':>12}"]
+        for r in self.summary():
+            rss = f"{r['rss_peak_delta_mb']:.1f}" if r["rss_peak_delta_mb"] is not None else "-"
+            alloc = f"{r['alloc_peak_mb']:.1f}" if r["alloc_peak_mb"] is not None else "-"
+            lines.append(f"{r['name']:<14}{r['count']:>5}{r['wall_s']:>11.3f}{r['mean_s']:>10.3f}"
+                         f"{r['max_s']:>9.3f}{r['cpu_s']:>9.3f}{rss:>11}{alloc:>12}")
+        return "\n".join(lines)
+
+# Process-wide tracer used by the loaders, analyzer, AI engines and GUI
+TRACER = Tracer()
+span = TRACER.span
+
+if os.environ.get(TRACE_MEMORY_ENV) == "1":
+    TRACER.start_memory()
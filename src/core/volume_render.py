@@ -0,0 +1,104 @@
+import numpy as np
+import pyvista as pv
+from typing import Dict, Optional, Tuple
+from vtkmodules.vtkCommonDataModel import vtkPiecewiseFunction
+from vtkmodules.vtkRenderingCore import vtkColorTransferFunction
+from src.core.structure import PatientVolume
+from src.core.pyramid import get_level
+
+# Default downsampling of volumes sent to the ray caster (a pyramid factor, 1 = full resolution)
+VOLUME_RENDER_FACTOR = 2
+# Intensity window of the quantization, as percentiles of the nonzero (brain) voxels
+QUANTIZE_PERCENTILES = (0.5, 99.5)
+# Quantized intensities at or below this value (background) stay fully transparent
+INTENSITY_FLOOR = 8
+
+def quantize_uint8(data: np.ndarray, window: Optional[Tuple[float, float]] = None) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """
+    Maps intensities linearly onto 0..255 (uint8: a quarter of float32 texture memory).
+    The window defaults to robust percentiles of the nonzero voxels, estimated on
+    every other voxel. Returns the quantized volume and the window used.
+    """
+    if window is None:
+        sample = data[::2, ::2, ::2]
+        sample = sample[sample != 0]
+        if sample.size == 0:
+            window = (0.0, 1.0)
+        else:
+            lo, hi = np.percentile(sample, QUANTIZE_PERCENTILES)
+            window = (float(lo), float(hi) if hi > lo else float(lo) + 1.0)
+
+    lo, hi = window
+    scaled = np.subtract(data, lo, dtype=np.float32)
+    scaled *= 255.0 / (hi - lo)
+    np.clip(scaled, 0, 255, out=scaled)
+    # Background stays exactly 0, whatever the window
+    scaled[data == 0] = 0
+    return scaled.astype(np.uint8), window
+
+def _grid(data: np.ndarray, patient: PatientVolume) -> pv.ImageData:
+    grid = pv.wrap(np.ascontiguousarray(data))
+    grid.spacing = patient.spacing
+    grid.origin = patient.origin
+    return grid
+
+def intensity_volume(patient: PatientVolume, modality: str = 't1',
+                     factor: int = VOLUME_RENDER_FACTOR) -> Optional[pv.ImageData]:
+    """Quantized (and block-averaged when factor > 1) modality, ready for add_volume."""
+    if modality not in patient.modalities:
+        return None
+    level = get_level(patient, factor)
+    quantized, _ = quantize_uint8(level.modalities[modality])
+    return _grid(quantized, level)
+
+def label_volume(patient: PatientVolume, factor: int = VOLUME_RENDER_FACTOR) -> Optional[pv.ImageData]:
+    """uint8 label volume (block-mode downsampled when factor > 1), ready for add_volume."""
+    if patient.mask is None:
+        return None
+    level = get_level(patient, factor)
+    return _grid(np.asarray(level.mask, dtype=np.uint8), level)
+
+def intensity_transfer(color: str, opacity: float):
+    """
+    Transfer functions of a quantized intensity volume: a ramp from transparent
+    background to `opacity` at the top of the window, tinted towards `color`.
+    """
+    r, g, b = pv.Color(color).float_rgb
+    ctf = vtkColorTransferFunction()
+    ctf.AddRGBPoint(0, 0.0, 0.0, 0.0)
+    ctf.AddRGBPoint(255, r, g, b)
+
+    otf = vtkPiecewiseFunction()
+    otf.AddPoint(0, 0.0)
+    otf.AddPoint(INTENSITY_FLOOR, 0.0)
+    otf.AddPoint(255, opacity)
+    return ctf, otf
+
+def label_transfer(labels: Dict[int, Tuple[str, float]]):
+    """
+    Per-label transfer functions of a label volume: label -> (color, opacity).
+    Every label is a flat step (transparent half a unit away), so no color or
+    opacity leaks between neighbouring label values. Unlisted labels are invisible.
+    """
+    ctf = vtkColorTransferFunction()
+    otf = vtkPiecewiseFunction()
+    otf.AddPoint(0, 0.0)
+    for label, (color, opacity) in sorted(labels.items()):
+        r, g, b = pv.Color(color).float_rgb
+        ctf.AddRGBPoint(label, r, g, b)
+        otf.AddPoint(label - 0.5, 0.0)
+        otf.AddPoint(label - 0.49, opacity)
+        otf.AddPoint(label + 0.49, opacity)
+        otf.AddPoint(label + 0.5, 0.0)
+    return ctf, otf
+
+def apply_transfer(volume_actor, ctf, otf, nearest: bool = False):
+    """Installs transfer functions on a volume actor returned by add_volume."""
+    prop = volume_actor.GetProperty()
+    prop.SetColor(ctf)
+    prop.SetScalarOpacity(otf)
+    if nearest:
+        # Interpolating between label values would invent labels at the boundaries
+        prop.SetInterpolationTypeToNearest()
+    else:
+        prop.SetInterpolationTypeToLinear()
@@ -1,69 +1,149 @@
 import os
 import glob
-import nibabel as nib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 from src.core.structure import PatientVolume
+from src.core.tracing import span
+from src.loaders.lazy_volume import LazyVolume, LazyModalities
+from src.loaders.nifti_io import decode_nifti, decoded_nbytes
+
+MODALITY_SUFFIXES = {
+    't1': '*_t1.nii*',
+    't1ce': '*_t1ce.nii*',
+    't2': '*_t2.nii*',
+    'flair': '*_flair.nii*'
+}
+MASK_SUFFIX = "*_seg.nii"
 
 class BraTSLoader:
-    def __init__(self, root_dir: str):
-        
+    def __init__(self, root_dir: str, lazy: bool = False, dtype=np.float32, decode_workers: int = 5,
+                 index=None, store=None):
+
         self.root_dir = root_dir
-    
-    def load_patient(self, patient_id: str) -> PatientVolume:
+        # Lazy mode: modalities are decoded (or memory-mapped) only when first accessed
+        self.lazy = lazy
+        # Intensity dtype of the modalities; None keeps the on-disk dtype (e.g. int16)
+        self.dtype = dtype
+        # Files of one case are decoded concurrently: gunzip and file I/O release the GIL
+        self.decode_workers = decode_workers
+        # Optional CohortIndex: file lookups come from the index instead of globbing
+        self.index = index
+        # Optional VolumeStore: cases converted to the pre-stacked format are mapped from there
+        self.store = store
+
+    def _find_files(self, patient_path: str) -> Dict[str, Optional[str]]:
+        """
+        Maps each modality name (and 'seg' for the mask) to its file, or None if missing.
+        """
+        files = {}
+        for mod_name, suffix in MODALITY_SUFFIXES.items():
+            found_files = glob.glob(os.path.join(patient_path, suffix))
+            files[mod_name] = found_files[0] if found_files else None
+
+        mask_files = glob.glob(os.path.join(patient_path, MASK_SUFFIX))
+        files['seg'] = mask_files[0] if mask_files else None
+        return files
+
+    def _open_file(self, name: str, file_path: str):
+        """Reads one file; returns (image, decoded array or lazy accessor)."""
+        # Imported here: nibabel is only needed once a case is actually read
+        import nibabel as nib
+        img = nib.load(file_path)
+        if name == 'seg':
+            return img, decode_nifti(img, np.uint8)
+        if self.lazy:
+            return img, LazyVolume(img, self.dtype)
+        return img, decode_nifti(img, self.dtype)
+
+    def load_patient(self, patient_id: str,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> PatientVolume:
+        """
+        Loads all modalities and the segmentation of one case.
+        The files are decoded concurrently on a bounded thread pool.
+        progress_callback(done, total) is called after each file.
+        In lazy mode only the headers of the modalities are read here.
+        """
+        with span("load", case=patient_id):
+            return self._load_patient(patient_id, progress_callback)
+
+    def _load_patient(self, patient_id: str,
+                      progress_callback: Optional[Callable[[int, int], None]]) -> PatientVolume:
+        if self.store is not None and patient_id in self.store:
+            patient = self.store.load_patient(patient_id)
+            if progress_callback is not None:
+                progress_callback(1, 1)
+            return patient
 
         patient_path = os.path.join(self.root_dir, patient_id)
 
-        if not os.path.exists(patient_path):
+        indexed = self.index is not None and patient_id in self.index
+        if not indexed and not os.path.exists(patient_path):
             raise FileNotFoundError(f"No patient folder: {patient_path}")
-        
+
         print(f"Loading: {patient_id}")
+        t0 = time.perf_counter()
 
         modalities = {}
         mask = None
         affine = None
         spacing = None
 
-        suffixes = {
-            't1': '*_t1.nii*',
-            't1ce': '*_t1ce.nii*',
-            't2': '*_t2.nii*',
-            'flair': '*_flair.nii*'
-        }
-
-        for mod_name, suffix in suffixes.items():
-            search_pattern = os.path.join(patient_path, suffix)
-            found_files = glob.glob(search_pattern)
-
-            if found_files:
-                
-                try:
-                    file_path = found_files[0]
-                    img = nib.load(file_path)
-                    data = img.get_fdata().astype(np.float32)
-
-                    modalities[mod_name] = data
-            
-                    if affine is None:
-                        affine = img.affine
-                        spacing = img.header.get_zooms()
-                
-                except Exception as e:
-                    print(f"Error loading {mod_name}: {e}")
-            else:
-                print("f Attention: {mod_name} modality not founds.")
-
-        mask_pattern = os.path.join(patient_path, "*_seg.nii")
-        mask_files = glob.glob(mask_pattern)
-        if mask_files:
-            try:
-                mask_img = nib.load(mask_files[0])
-                mask = mask_img.get_fdata().astype(np.uint8)
-                print(f"Mask loaded.")
-            except Exception as e:
-                print(f"Error loading mask: {e}")
+        files = self.index.files(patient_id) if indexed else self._find_files(patient_path)
+
+        total_files = len(files)
+        done_files = 0
+
+        def report():
+            if progress_callback is not None:
+                progress_callback(done_files, total_files)
+
+        for name, file_path in files.items():
+            if file_path is None:
+                if name == 'seg':
+                    print(f"Mask not found.")
+                else:
+                    print(f"Attention: {name} modality not found.")
+                done_files += 1
+                report()
+
+        images = {}
+        present = {name: path for name, path in files.items() if path is not None}
+        if present:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.decode_workers, len(present)))) as pool:
+                futures = {pool.submit(self._open_file, name, path): name for name, path in present.items()}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        img, data = future.result()
+                        images[name] = img
+                        if name == 'seg':
+                            mask = data
+                            print(f"Mask loaded.")
+                        else:
+                            modalities[name] = data
+                    except Exception as e:
+                        print(f"Error loading {name}: {e}")
+
+                    done_files += 1
+                    report()
+
+        # Keep the usual modality order and take the geometry from the first one found
+        modalities = {name: modalities[name] for name in MODALITY_SUFFIXES if name in modalities}
+        for name in modalities:
+            affine = images[name].affine
+            spacing = images[name].header.get_zooms()
+            break
+
+        if self.lazy:
+            decoded_mb = decoded_nbytes([mask]) / 2**20
+            modalities = LazyModalities(modalities)
         else:
-            print(f"Mask not found.")
-            
+            decoded_mb = decoded_nbytes(list(modalities.values()) + [mask]) / 2**20
+        print(f"Loaded {patient_id} in {time.perf_counter() - t0:.2f}s ({decoded_mb:.0f} MB decoded in memory)")
+
         return PatientVolume(
             id=patient_id,
             modalities=modalities,
@@ -71,3 +151,68 @@ class BraTSLoader:
             affine=affine,
             spacing=spacing
         )
+
+    def list_patients(self, require_seg: bool = False) -> List[str]:
+        """
+        Available case ids. Served from the index when there is one,
+        otherwise the patient folders under root_dir are listed.
+        """
+        if self.index is not None:
+            return self.index.patient_ids(require_seg=require_seg)
+
+        if not os.path.isdir(self.root_dir):
+            return []
+        ids = sorted(name for name in os.listdir(self.root_dir)
+                     if os.path.isdir(os.path.join(self.root_dir, name)) and not name.startswith('.'))
+        if require_seg:
+            ids = [pid for pid in ids if glob.glob(os.path.join(self.root_dir, pid, MASK_SUFFIX))]
+        return ids
+
+    def iter_patients(self, patient_ids: Iterable[str], prefetch: int = 1,
+                      on_error: Optional[Callable[[str, Exception], None]] = None) -> Iterator[PatientVolume]:
+        """
+        Yields the given cases in order while the next `prefetch` cases are loaded
+        in the background, so processing of one case overlaps the I/O of the next.
+        A case that fails to load raises when it is reached, unless on_error is given:
+        then on_error(patient_id, exception) is called and the case is skipped.
+        """
+        ids = iter(patient_ids)
+
+        def result(patient_id, load):
+            try:
+                return load()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(patient_id, e)
+                return None
+
+        if prefetch <= 0:
+            for patient_id in ids:
+                patient = result(patient_id, lambda: self.load_patient(patient_id))
+                if patient is not None:
+                    yield patient
+            return
+
+        # A dedicated pool: prefetch tasks wait on the per-file decode pools,
+        # so they must never share a pool with them.
+        pool = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="prefetch")
+        pending = deque()
+        try:
+            for patient_id in ids:
+                pending.append((patient_id, pool.submit(self.load_patient, patient_id)))
+                if len(pending) > prefetch:
+                    done_id, future = pending.popleft()
+                    patient = result(done_id, future.result)
+                    if patient is not None:
+                        yield patient
+
+            while pending:
+                done_id, future = pending.popleft()
+                patient = result(done_id, future.result)
+                if patient is not None:
+                    yield patient
+        finally:
+            for _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
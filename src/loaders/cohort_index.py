@@ -0,0 +1,165 @@
+import os
+import glob
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional
+from src.loaders.brats_loader import MODALITY_SUFFIXES, MASK_SUFFIX
+
+INDEX_VERSION = 1
+DEFAULT_INDEX_NAME = "cohort_index.json"
+# Indexes live in the user cache, not in the (possibly read-only or shared) dataset
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "neurovoxel", "indexes")
+
+def default_index_path(root_dir: str) -> str:
+    """Per-cohort index file in DEFAULT_INDEX_DIR, named after the absolute root path."""
+    root = os.path.abspath(root_dir)
+    digest = hashlib.blake2b(root.encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(DEFAULT_INDEX_DIR, f"{os.path.basename(root) or 'root'}-{digest}-{DEFAULT_INDEX_NAME}")
+
+class CohortIndex:
+    """
+    Persistent index of a BraTS cohort (one folder per patient under root_dir).
+    For every patient it records the file of each modality and of the mask,
+    together with shape, dtype, spacing, affine and mtime read from the headers.
+    The index is stored as JSON and refreshed incrementally: a patient folder is
+    only rescanned when its mtime or the mtime of one of its files changed.
+    Lookups and filters work from memory and never touch the filesystem.
+    By default the JSON goes to the user cache (see default_index_path); if it cannot
+    be written, the index is kept in memory only.
+    """
+    def __init__(self, root_dir: str, index_path: Optional[str] = None):
+        self.root_dir = root_dir
+        self.index_path = index_path or default_index_path(root_dir)
+        self.patients: Dict[str, dict] = {}
+        self._read()
+
+    def _read(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.patients = data.get("patients", {})
+        except Exception as e:
+            print(f"Cohort index unreadable, it will be rebuilt: {e}")
+            self.patients = {}
+
+    def save(self) -> bool:
+        """Writes the index; returns False (the in-memory index stays valid) if it cannot be written."""
+        tmp_path = self.index_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "root_dir": self.root_dir, "patients": self.patients}, f)
+            os.replace(tmp_path, self.index_path)
+            return True
+        except OSError as e:
+            print(f"Cohort index not saved ({self.index_path}): {e}")
+            return False
+
+    def refresh(self) -> bool:
+        """
+        Brings the index up to date with root_dir and saves it if anything changed.
+        Returns True when the index was modified.
+        """
+        if not os.path.isdir(self.root_dir):
+            return False
+
+        changed = False
+        seen = set()
+        with os.scandir(self.root_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir() or entry.name.startswith('.'):
+                    continue
+                seen.add(entry.name)
+
+                record = self.patients.get(entry.name)
+                if record is not None and not self._is_stale(entry.path, record):
+                    continue
+
+                self.patients[entry.name] = self._scan_patient(entry.path)
+                changed = True
+
+        for patient_id in list(self.patients):
+            if patient_id not in seen:
+                del self.patients[patient_id]
+                changed = True
+
+        if changed:
+            self.save()
+        return changed
+
+    def _is_stale(self, patient_path: str, record: dict) -> bool:
+        # Adding or removing a file changes the folder mtime,
+        # rewriting a file in place changes the file mtime.
+        if os.stat(patient_path).st_mtime != record["dir_mtime"]:
+            return True
+        for info in record["files"].values():
+            try:
+                if os.stat(os.path.join(patient_path, info["path"])).st_mtime != info["mtime"]:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def _scan_patient(self, patient_path: str) -> dict:
+        # Imported on first scan: an up-to-date index never needs nibabel
+        import nibabel as nib
+
+        patterns = dict(MODALITY_SUFFIXES)
+        patterns['seg'] = MASK_SUFFIX
+
+        files = {}
+        for name, suffix in patterns.items():
+            found_files = sorted(glob.glob(os.path.join(patient_path, suffix)))
+            if not found_files:
+                continue
+            file_path = found_files[0]
+            try:
+                # nib.load only parses the header; voxel data is not read
+                img = nib.load(file_path)
+                files[name] = {
+                    "path": os.path.basename(file_path),
+                    "mtime": os.stat(file_path).st_mtime,
+                    "shape": list(img.shape),
+                    "dtype": str(img.get_data_dtype()),
+                    "spacing": [float(z) for z in img.header.get_zooms()],
+                    "affine": img.affine.tolist()
+                }
+            except Exception as e:
+                print(f"Index: could not read {file_path}: {e}")
+
+        return {"dir_mtime": os.stat(patient_path).st_mtime, "files": files}
+
+    def __contains__(self, patient_id: str) -> bool:
+        return patient_id in self.patients
+
+    def __len__(self) -> int:
+        return len(self.patients)
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        return self.patients.get(patient_id)
+
+    def files(self, patient_id: str) -> Dict[str, Optional[str]]:
+        """
+        Absolute file path for each modality and 'seg' (None if missing),
+        in the same form as BraTSLoader expects.
+        """
+        record = self.patients[patient_id]
+        patient_path = os.path.join(self.root_dir, patient_id)
+        names = list(MODALITY_SUFFIXES) + ['seg']
+        return {
+            name: os.path.join(patient_path, record["files"][name]["path"]) if name in record["files"] else None
+            for name in names
+        }
+
+    def patient_ids(self, require_seg: bool = False,
+                    require_modalities: Iterable[str] = ()) -> List[str]:
+        """
+        Sorted patient ids, optionally only cases with a mask and/or the given modalities.
+        """
+        required = set(require_modalities)
+        if require_seg:
+            required.add('seg')
+        return sorted(pid for pid, record in self.patients.items() if required <= set(record["files"]))
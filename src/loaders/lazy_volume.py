@@ -0,0 +1,76 @@
+import threading
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Dict, Iterator
+import numpy as np
+from src.loaders.nifti_io import decode_nifti
+
+if TYPE_CHECKING:
+    import nibabel as nib
+
+class LazyVolume:
+    """
+    On-demand accessor for one NIfTI volume, backed by nibabel's array proxy.
+    Nothing is decoded until load() is called. For uncompressed .nii files
+    the proxy is memory-mapped, so an unscaled volume already stored in the
+    target dtype is returned as a view of the file instead of a copy.
+    """
+    def __init__(self, img: "nib.Nifti1Image", dtype=np.float32):
+        self.img = img
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.img.shape
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._data is not None
+
+    def load(self) -> np.ndarray:
+        if self._data is None:
+            # Several mesh/inference threads may touch the same modality at once
+            with self._lock:
+                if self._data is None:
+                    self._data = self._decode()
+        return self._data
+
+    def _decode(self) -> np.ndarray:
+        return decode_nifti(self.img, self.dtype)
+
+    def release(self):
+        """Drops the decoded array; the next load() decodes (or maps) it again."""
+        with self._lock:
+            self._data = None
+
+class LazyModalities(Mapping):
+    """
+    Read-only {modality: array} mapping whose arrays are decoded on first access.
+    Membership tests and key listing never decode anything.
+    """
+    def __init__(self, volumes: Dict[str, LazyVolume]):
+        self.volumes = volumes
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.volumes[name].load()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.volumes)
+
+    def __len__(self) -> int:
+        return len(self.volumes)
+
+    def __contains__(self, name) -> bool:
+        # Mapping's default __contains__ goes through __getitem__, which would decode
+        return name in self.volumes
+
+    def is_loaded(self, name: str) -> bool:
+        return self.volumes[name].is_loaded
+
+    def release(self, name: str):
+        self.volumes[name].release()
+
+    def __repr__(self):
+        state = {name: ("loaded" if vol.is_loaded else "lazy") for name, vol in self.volumes.items()}
+        return f"<LazyModalities {state}>"
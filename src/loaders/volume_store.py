@@ -0,0 +1,177 @@
+import os
+import json
+import shutil
+import argparse
+import threading
+import numpy as np
+from typing import Iterable, List, Optional
+from src.core.structure import PatientVolume, MODALITIES
+from src.loaders.lazy_volume import LazyModalities
+
+IMAGE_FILE = "image.npy"
+MASK_FILE = "mask.npy"
+META_FILE = "meta.json"
+
+class StoredChannel:
+    """
+    One modality of a stored case: a view of channel i of the stacked array.
+    float32 channels are returned as-is (zero copy); float16 channels are
+    widened to float32 on first access, since VTK has no half-float support.
+    Same interface as LazyVolume, so LazyModalities can wrap it.
+    """
+    def __init__(self, stacked: np.ndarray, index: int):
+        self.stacked = stacked
+        self.index = index
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def shape(self):
+        return self.stacked.shape[1:]
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._data is not None
+
+    def load(self) -> np.ndarray:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    channel = self.stacked[self.index]
+                    if channel.dtype == np.float16:
+                        channel = channel.astype(np.float32)
+                    self._data = channel
+        return self._data
+
+    def release(self):
+        with self._lock:
+            self._data = None
+
+class VolumeStore:
+    """
+    Pre-stacked, memory-mappable copy of a cohort. Every case is a folder with
+      image.npy  contiguous (4, ...) array, channels in MODALITIES order (float32 or float16)
+      mask.npy   uint8 segmentation (if the case has one)
+      meta.json  id, shape, dtype, spacing and affine
+    Opening a case maps the files instead of reading them, so the model input is
+    a zero-copy view (torch.from_numpy on the mapped array).
+    """
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+
+    def _case_dir(self, patient_id: str) -> str:
+        return os.path.join(self.store_dir, patient_id)
+
+    def __contains__(self, patient_id: str) -> bool:
+        return os.path.exists(os.path.join(self._case_dir(patient_id), META_FILE))
+
+    def patient_ids(self) -> List[str]:
+        if not os.path.isdir(self.store_dir):
+            return []
+        return sorted(pid for pid in os.listdir(self.store_dir) if pid in self)
+
+    def write(self, patient: PatientVolume, dtype=np.float32):
+        """
+        Writes one case. Channels are copied straight into the mapped output file,
+        so the 4-channel volume is never stacked in memory.
+        """
+        missing = [m for m in MODALITIES if m not in patient.modalities]
+        if missing:
+            raise ValueError(f"missing modalities {missing}")
+
+        dtype = np.dtype(dtype)
+        shape = patient.modalities[MODALITIES[0]].shape
+
+        # Build in a temporary folder and rename, so a half-written case is never visible
+        case_dir = self._case_dir(patient.id)
+        tmp_dir = case_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        image = np.lib.format.open_memmap(os.path.join(tmp_dir, IMAGE_FILE), mode='w+',
+                                          dtype=dtype, shape=(len(MODALITIES),) + tuple(shape))
+        for i, mod_name in enumerate(MODALITIES):
+            image[i] = patient.modalities[mod_name]
+        image.flush()
+        del image
+
+        if patient.mask is not None:
+            np.save(os.path.join(tmp_dir, MASK_FILE), np.ascontiguousarray(patient.mask, dtype=np.uint8))
+
+        meta = {
+            "id": patient.id,
+            "modalities": list(MODALITIES),
+            "shape": list(shape),
+            "dtype": dtype.name,
+            "spacing": [float(z) for z in patient.spacing],
+            "affine": np.asarray(patient.affine).tolist()
+        }
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(case_dir, ignore_errors=True)
+        os.replace(tmp_dir, case_dir)
+
+    def load_patient(self, patient_id: str) -> PatientVolume:
+        """Opens a stored case as memory maps."""
+        case_dir = self._case_dir(patient_id)
+        if patient_id not in self:
+            raise FileNotFoundError(f"No stored case: {case_dir}")
+
+        with open(os.path.join(case_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        # Copy-on-write mapping: writeable for torch.from_numpy, the file itself is never modified
+        stacked = np.load(os.path.join(case_dir, IMAGE_FILE), mmap_mode='c')
+
+        mask = None
+        mask_path = os.path.join(case_dir, MASK_FILE)
+        if os.path.exists(mask_path):
+            mask = np.load(mask_path, mmap_mode='c')
+
+        modalities = LazyModalities({
+            mod_name: StoredChannel(stacked, i) for i, mod_name in enumerate(meta["modalities"])
+        })
+
+        return PatientVolume(
+            id=meta["id"],
+            modalities=modalities,
+            mask=mask,
+            affine=np.array(meta["affine"]),
+            spacing=tuple(meta["spacing"]),
+            stacked=stacked
+        )
+
+def convert_cohort(loader, store: VolumeStore, patient_ids: Optional[Iterable[str]] = None,
+                   dtype=np.float32, overwrite: bool = False) -> List[str]:
+    """
+    One-time conversion of NIfTI cases into the volume store. Returns the converted ids.
+    """
+    if patient_ids is None:
+        patient_ids = loader.list_patients()
+    todo = [pid for pid in patient_ids if overwrite or pid not in store]
+
+    converted = []
+    # A case that fails to load is reported and skipped, like one that fails to store
+    on_error = lambda patient_id, e: print(f"Could not load {patient_id}: {e}")
+    for patient in loader.iter_patients(todo, prefetch=1, on_error=on_error):
+        try:
+            store.write(patient, dtype)
+            converted.append(patient.id)
+            print(f"Stored {patient.id}")
+        except Exception as e:
+            print(f"Could not store {patient.id}: {e}")
+    return converted
+
+if __name__ == "__main__":
+    from src.loaders.brats_loader import BraTSLoader
+
+    parser = argparse.ArgumentParser(description="Convert a BraTS cohort into a pre-stacked volume store.")
+    parser.add_argument("root", help="BraTS root folder (one folder per patient)")
+    parser.add_argument("store", help="Output store folder")
+    parser.add_argument("--float16", action="store_true", help="Store intensities as float16 (half the size)")
+    parser.add_argument("--overwrite", action="store_true", help="Re-convert cases already in the store")
+    args = parser.parse_args()
+
+    convert_cohort(BraTSLoader(args.root), VolumeStore(args.store),
+                   dtype=np.float16 if args.float16 else np.float32, overwrite=args.overwrite)
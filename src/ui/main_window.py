@@ -1,18 +1,30 @@
 import sys
 import os
+import dataclasses
+import threading
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QSlider, 
-                             QCheckBox, QFrame, QGroupBox, QMessageBox, QProgressBar)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from pyvistaqt import QtInteractor
-import pyvista as pv
+                             QCheckBox, QFrame, QGroupBox, QMessageBox, QProgressBar,
+                             QComboBox, QPlainTextEdit, QFileDialog)
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QFont
+
+# Heavy modules are not imported here: pyvista/VTK (3D viewer, analyzer and mesh
+# pipeline) are loaded right after the window is first shown, and torch/onnxruntime
+# only when the AI engine is built.
 
 # Ensure project modules are reachable
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from src.loaders.brats_loader import BraTSLoader
-from src.core.analyzer import VolumeAnalyzer
-# --- YENİ EKLENEN IMPORT ---
-from src.ai.inference import TumorSegmentor
+from src.loaders.cohort_index import CohortIndex
+from src.core.mesh_cache import DEFAULT_CACHE_DIR
+from src.core.session_cache import SessionCache, DEFAULT_SESSION_CACHE_BYTES
+from src.core.pyramid import PYRAMID_FACTORS
+from src.core.mask_diff import diff_masks
+from src.core.tracing import TRACER, span
+from src.ai.patching import InferenceCancelled
+from src.ui.slice_view import SlicePanel
 
 # --- CONFIGURATION & STYLES ---
 THEME_COLORS = {
@@ -109,6 +121,20 @@ QLabel#MetaLabel {{
     padding-left: 5px;
 }}
 
+/* --- PATIENT PICKER --- */
+QComboBox {{
+    background-color: #263238;
+    color: {THEME_COLORS['text']};
+    border: 1px solid #37474f;
+    border-radius: 6px;
+    padding: 6px 10px;
+}}
+QComboBox QAbstractItemView {{
+    background-color: #23262b;
+    color: {THEME_COLORS['text']};
+    selection-background-color: {THEME_COLORS['accent']};
+}}
+
 /* --- SLIDERS & CHECKBOXES --- */
 QSlider::groove:horizontal {{
     border: 1px solid #333;
@@ -136,25 +162,106 @@ QCheckBox::indicator {{
 }}
 """
 
+# Layer key -> (mask label, None for the T1 shell), color, default opacity
+LAYERS = {
+    'brain': (None, '#eceff1', 0.10),
+    'necrotic': (1, '#ff5252', 1.0),
+    'edema': (2, '#ffd740', 0.25),
+    'active': (4, '#69f0ae', 1.0)
+}
+
+# Share of the progress bar spent on loading files, the rest is meshing
+LOAD_PROGRESS_SHARE = 50
+
+# Delay between the first show of the window and building the 3D viewer
+STARTUP_DEFER_MS = 50
+
+# Progress bar range of each inference stage
+AI_STAGE_PROGRESS = {
+    'preprocess': (0, 10),
+    'forward': (10, 90),
+    'postprocess': (90, 100)
+}
+
 class LoadWorker(QThread):
     finished = pyqtSignal(object) 
     error = pyqtSignal(str)       
     progress = pyqtSignal(int)    
 
-    def __init__(self, loader, patient_id):
+    def __init__(self, session, patient_id):
         super().__init__()
-        self.loader = loader
+        self.session = session
         self.patient_id = patient_id
 
     def run(self):
         try:
-            self.progress.emit(10)
-            patient = self.loader.load_patient(self.patient_id)
-            self.progress.emit(60)
+            # Through the session cache, which also computes the mask statistics (needed by
+            # the metadata panel and the mesher) off the GUI thread. If a prefetch of this
+            # case is under way, its result is awaited instead of loading twice.
+            patient = self.session.load(
+                self.patient_id,
+                progress_callback=lambda done, total: self.progress.emit(int(LOAD_PROGRESS_SHARE * done / total))
+            )
             self.finished.emit(patient)
         except Exception as e:
             self.error.emit(str(e))
 
+class InferenceWorker(QThread):
+    """
+    Runs one segmentation off the GUI thread. The result is a copy of the patient
+    carrying the predicted mask, with its label statistics already computed, and the
+    difference to the input mask (None if the input had no mask).
+    """
+    stage = pyqtSignal(str, int, int)   # stage, done, total
+    # Not named `finished`: QThread.finished (emitted once run() has returned) releases the worker
+    result = pyqtSignal(object, object)     # predicted patient, MaskDiff
+    cancelled = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, get_segmentor, analyzer, patient):
+        super().__init__()
+        # Callable returning the engine: building it (first use) also happens off the GUI thread
+        self.get_segmentor = get_segmentor
+        self.analyzer = analyzer
+        self.patient = patient
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """Cooperative: the segmentor stops at the next stage or patch batch."""
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            mask = self.get_segmentor().predict(
+                self.patient,
+                stage_callback=lambda stage, done, total: self.stage.emit(stage, done, total),
+                cancel_event=self.cancel_event
+            )
+            if mask is None:
+                self.error.emit("Preprocessing failed (see console).")
+                return
+            predicted = dataclasses.replace(self.patient, mask=mask, label_stats=None, pyramid={})
+            diff = None
+            if self.patient.mask is not None and self.patient.mask.shape == mask.shape:
+                # Statistics follow from the change instead of a full pass over the new mask
+                diff = diff_masks(self.patient.mask, mask)
+                self.analyzer.update_label_stats(self.patient, predicted, diff)
+            else:
+                self.analyzer.compute_label_stats(predicted)
+            self.result.emit(predicted, diff)
+        except InferenceCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+
+class MeshSignals(QObject):
+    """
+    Bridges MeshPipeline callbacks (worker threads) to the GUI thread.
+    Every signal carries the load generation so results of a cancelled load can be dropped.
+    """
+    mesh_ready = pyqtSignal(int, str, object)   # generation, layer key, LOD meshes (finest first)
+    progress = pyqtSignal(int, int, int)        # generation, done, total
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -163,22 +270,109 @@ class MainWindow(QMainWindow):
         self.setStyleSheet(STYLESHEET)
         
         # --- Data Configuration ---
-        self.DATA_ROOT = r"C:\Users\semih\Desktop\d1\spatial-comp-lab\neuro-voxel\data"
+        # NEUROVOXEL_DATA_ROOT overrides the default cohort folder
+        self.DATA_ROOT = os.environ.get("NEUROVOXEL_DATA_ROOT", r"C:\Users\semih\Desktop\d1\spatial-comp-lab\neuro-voxel\data")
         self.PATIENT_ID = "sample_patient"
+        self.MESH_CACHE_DIR = DEFAULT_CACHE_DIR
+        # Exported U-Net (python -m src.ai.onnx_export); when present, inference runs on
+        # onnxruntime and torch is never imported in the GUI process
+        self.ONNX_MODEL_PATH = os.path.join(self.DATA_ROOT, "unet.onnx")
+        # RAM budget of the recently opened cases (volumes, stats and meshes) kept for quick switching
+        self.SESSION_CACHE_BYTES = DEFAULT_SESSION_CACHE_BYTES
+        # Load the next case of the picker in the background once a case is shown
+        self.PREFETCH_NEXT = True
+        # Refresh period of the stage timing panel
+        self.TIMING_REFRESH_MS = 1000
         
         # Initialize Logic Modules
-        self.loader = BraTSLoader(self.DATA_ROOT)
-        self.analyzer = VolumeAnalyzer()
+        # Cohort index: scanned once, then refreshed incrementally by mtime
+        self.index = CohortIndex(self.DATA_ROOT)
+        self.index.refresh()
+
+        # Lazy: only the modalities a view actually touches (T1 for the shell) get decoded.
+        # dtype=None keeps intensities in their on-disk integer dtype.
+        self.loader = BraTSLoader(self.DATA_ROOT, lazy=True, dtype=None, index=self.index)
+        # Analyzer and mesh pipeline import pyvista/VTK: built by init_analysis, after the first paint
+        self.analyzer = None
+        self.mesh_pipeline = None
+        self.session = SessionCache(self.loader, max_bytes=self.SESSION_CACHE_BYTES)
+        self.mesh_signals = MeshSignals()
+        self.mesh_signals.mesh_ready.connect(self.on_mesh_ready)
+        self.mesh_signals.progress.connect(self.on_mesh_progress)
+        self.mesh_job = None
+        self.mesh_generation = 0
         
-        # --- AI MOTORUNU BAŞLAT ---
-        # Bu işlem PyTorch/CUDA kontrolü yapar
-        self.segmentor = TumorSegmentor()
+        # --- AI MOTORU ---
+        # Built on first use (or warmed in the background once the window is up):
+        # constructing it imports torch, probes CUDA and allocates the U-Net.
+        self.WARM_UP_AI = True
+        self.segmentor = None
+        self.segmentor_lock = threading.Lock()
 
         self.patient = None
+        # Layer key -> one actor per level of detail (finest first), and the meshes behind them
         self.actors = {} 
+        self.lods = {}
+        # While the camera moves the coarsest level is shown, the finest once it stops
+        self.interacting = False
+
+        # 'surface' (meshes) or 'volume' (ray-cast volumes, no meshing at all)
+        self.render_mode = 'surface'
+        # 'brain' (T1 intensities) and 'labels' (mask) volume actors
+        self.volume_actors = {}
+        # Patient whose surfaces the mesh actors show; surfaces are built on demand
+        self.meshed_patient = None
+        self.layer_controls = {}
+
+        # AI jobs: one worker at a time, repeat clicks wait in the queue.
+        # case_generation changes on every load, so results for a replaced case are dropped.
+        self.ai_worker = None
+        self.ai_queue = deque()
+        self.case_generation = 0
 
         self.init_ui()
 
+        # Runs shortly after the event loop starts, so the first paint of the window
+        # happens before the VTK widget and the AI engine are built
+        QTimer.singleShot(STARTUP_DEFER_MS, self.finish_startup)
+
+    def finish_startup(self):
+        self.init_analysis()
+        self.init_viewer()
+        if self.WARM_UP_AI:
+            threading.Thread(target=self.get_segmentor, name="ai-warmup", daemon=True).start()
+
+    def init_analysis(self):
+        """Creates the analyzer and mesh pipeline (pyvista + VTK import) on first need."""
+        if self.analyzer is not None:
+            return
+        from src.core.analyzer import VolumeAnalyzer
+        from src.core.mesh_cache import MeshCache
+        from src.core.mesh_pipeline import MeshPipeline
+
+        self.analyzer = VolumeAnalyzer(mesh_cache=MeshCache(self.MESH_CACHE_DIR))
+        self.mesh_pipeline = MeshPipeline(self.analyzer)
+        self.session.analyzer = self.analyzer
+
+    def get_segmentor(self):
+        """The AI engine, built on first call. Thread-safe, so it can be warmed in the background."""
+        with self.segmentor_lock:
+            if self.segmentor is None:
+                self.segmentor = self.create_segmentor()
+            return self.segmentor
+
+    def create_segmentor(self):
+        """ONNX engine if an exported model is configured, otherwise the PyTorch engine."""
+        if os.path.exists(self.ONNX_MODEL_PATH):
+            try:
+                from src.ai.onnx_engine import OnnxSegmentor
+                return OnnxSegmentor(self.ONNX_MODEL_PATH)
+            except ImportError as e:
+                print(f"{e}; falling back to PyTorch")
+
+        from src.ai.inference import TumorSegmentor
+        return TumorSegmentor()
+
     def init_ui(self):
         """Constructs the main layout and widgets."""
         main_widget = QWidget()
@@ -210,6 +404,17 @@ class MainWindow(QMainWindow):
         panel_layout.addWidget(desc)
 
         # 2. Action Section (Buttons)
+
+        # PATIENT PICKER (served from the cohort index)
+        self.patient_picker = QComboBox()
+        patient_ids = self.loader.list_patients()
+        # The configured case is preselected only if the cohort has it, otherwise the first case
+        if self.PATIENT_ID not in patient_ids and patient_ids:
+            self.PATIENT_ID = patient_ids[0]
+        self.patient_picker.addItems(patient_ids)
+        self.patient_picker.setCurrentText(self.PATIENT_ID)
+        self.patient_picker.currentTextChanged.connect(self.select_patient)
+        panel_layout.addWidget(self.patient_picker)
         
         # LOAD BUTTON
         self.btn_load = QPushButton(f"LOAD CASE: {self.PATIENT_ID}")
@@ -231,6 +436,12 @@ class MainWindow(QMainWindow):
         self.btn_ai.clicked.connect(self.run_ai_segmentation)
         self.btn_ai.setEnabled(False) # Veri yüklenmeden basılamaz
         panel_layout.addWidget(self.btn_ai)
+
+        self.btn_ai_cancel = QPushButton("CANCEL AI")
+        self.btn_ai_cancel.setCursor(Qt.PointingHandCursor)
+        self.btn_ai_cancel.clicked.connect(self.cancel_ai)
+        self.btn_ai_cancel.setVisible(False)
+        panel_layout.addWidget(self.btn_ai_cancel)
         # ------------------------------
 
         # 3. Metadata Section
@@ -257,6 +468,12 @@ class MainWindow(QMainWindow):
         lbl_vis.setObjectName("SubHeader")
         panel_layout.addWidget(lbl_vis)
 
+        # Surface meshes <-> direct volume rendering
+        self.btn_render_mode = QPushButton("SWITCH TO VOLUME RENDERING")
+        self.btn_render_mode.setCursor(Qt.PointingHandCursor)
+        self.btn_render_mode.clicked.connect(self.toggle_render_mode)
+        panel_layout.addWidget(self.btn_render_mode)
+
         # Context Layer (Brain Shell)
         self.brain_container = QWidget() 
         brain_layout = QVBoxLayout(self.brain_container)
@@ -281,6 +498,12 @@ class MainWindow(QMainWindow):
         
         panel_layout.addWidget(tumor_group)
 
+        # Per-stage timings of load / decode / mesh / AI / render spans
+        self.cb_timings = QCheckBox("Show stage timings")
+        self.cb_timings.setStyleSheet("color: #78909c; font-size: 9pt;")
+        self.cb_timings.stateChanged.connect(self.toggle_timing_panel)
+        panel_layout.addWidget(self.cb_timings)
+
         panel_layout.addStretch()
 
         # Footer
@@ -292,13 +515,76 @@ class MainWindow(QMainWindow):
         layout.addWidget(control_panel)
         
         # ===========================
-        # RIGHT PANEL: 3D VIEWER
+        # RIGHT PANEL: 3D VIEWER + SLICES
         # ===========================
-        self.plotter = QtInteractor(main_widget)
+        right_panel = QWidget()
+        right_layout = QVBoxLayout(right_panel)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        right_layout.setSpacing(0)
+
+        # Placeholder until init_viewer swaps in the VTK widget
+        self.plotter = None
+        self.viewer_layout = right_layout
+        self.viewer_placeholder = QLabel("Initializing 3D viewer...")
+        self.viewer_placeholder.setAlignment(Qt.AlignCenter)
+        self.viewer_placeholder.setStyleSheet("background-color: #050505; color: #455a64;")
+        right_layout.addWidget(self.viewer_placeholder, 3)
+
+        # Axial / coronal / sagittal panes, shown once a case is loaded
+        self.slice_panel = SlicePanel()
+        self.slice_panel.setVisible(False)
+        right_layout.addWidget(self.slice_panel, 2)
+        self.update_slice_overlay()
+
+        # Stage timing table (tracer summary), refreshed while visible
+        self.timing_panel = QWidget()
+        timing_layout = QHBoxLayout(self.timing_panel)
+        timing_layout.setContentsMargins(4, 4, 4, 4)
+        self.timing_text = QPlainTextEdit()
+        self.timing_text.setReadOnly(True)
+        self.timing_text.setFont(QFont("Monospace", 8))
+        self.timing_text.setStyleSheet("background-color: #050505; color: #b0bec5;")
+        timing_layout.addWidget(self.timing_text, 1)
+        timing_buttons = QVBoxLayout()
+        btn_export_trace = QPushButton("EXPORT TRACE")
+        btn_export_trace.setCursor(Qt.PointingHandCursor)
+        btn_export_trace.clicked.connect(self.export_trace)
+        timing_buttons.addWidget(btn_export_trace)
+        btn_clear_trace = QPushButton("CLEAR")
+        btn_clear_trace.setCursor(Qt.PointingHandCursor)
+        btn_clear_trace.clicked.connect(self.clear_trace)
+        timing_buttons.addWidget(btn_clear_trace)
+        timing_buttons.addStretch()
+        timing_layout.addLayout(timing_buttons)
+        self.timing_panel.setVisible(False)
+        right_layout.addWidget(self.timing_panel, 1)
+
+        self.timing_timer = QTimer(self)
+        self.timing_timer.setInterval(self.TIMING_REFRESH_MS)
+        self.timing_timer.timeout.connect(self.refresh_timings)
+
+        layout.addWidget(right_panel)
+
+    def init_viewer(self):
+        """Creates the PyVista interactor (pyvistaqt + VTK import) in place of the placeholder."""
+        if self.plotter is not None:
+            return
+        from pyvistaqt import QtInteractor
+
+        self.plotter = QtInteractor(self.centralWidget())
         self.plotter.set_background(color="#050505", top="#101520")
         self.plotter.enable_eye_dome_lighting()
         
-        layout.addWidget(self.plotter)
+        self.viewer_layout.replaceWidget(self.viewer_placeholder, self.plotter)
+        self.viewer_placeholder.deleteLater()
+
+        self.plotter.iren.add_observer("StartInteractionEvent", self.on_interaction_start)
+        self.plotter.iren.add_observer("EndInteractionEvent", self.on_interaction_end)
+
+        # Every frame the render window draws is traced as one "render" span
+        self.render_span = None
+        self.plotter.render_window.AddObserver("StartEvent", self.on_render_start)
+        self.plotter.render_window.AddObserver("EndEvent", self.on_render_end)
 
     def create_layer_control(self, parent_layout, title, key, color, tooltip="", default_opacity=1.0):
         container = QWidget()
@@ -341,18 +627,45 @@ class MainWindow(QMainWindow):
         
         parent_layout.addWidget(container)
         
+        self.layer_controls[key] = (cb, slider)
         cb.stateChanged.connect(lambda state: self.toggle_visibility(key, state))
         slider.valueChanged.connect(lambda val: self.update_opacity(key, val))
 
     # --- LOGIC HANDLING ---
 
+    def select_patient(self, patient_id):
+        self.PATIENT_ID = patient_id
+        self.btn_load.setText(f"LOAD CASE: {patient_id}")
+        self.lbl_patient_id.setText(f"ID: {patient_id}")
+
     def start_loading(self):
+        # A load clicked before finish_startup ran still needs the analyzer for its statistics
+        self.init_analysis()
         self.btn_load.setEnabled(False)
         self.btn_ai.setEnabled(False) # Yükleme sırasında AI kapalı
         self.progress_bar.setVisible(True)
-        self.progress_bar.setValue(10)
-        
-        self.loader_thread = LoadWorker(self.loader, self.PATIENT_ID)
+        self.progress_bar.setValue(0)
+
+        # Drop any mesh build and inference still running for the previous load
+        if self.mesh_job is not None:
+            self.mesh_job.cancel()
+            self.mesh_job = None
+        self.mesh_generation += 1
+        self.case_generation += 1
+        self.cancel_ai()
+        self.btn_ai.setText("RUN AI DIAGNOSIS")
+        self.btn_ai.setStyleSheet("")
+
+        # A recently viewed case reopens from the session cache; RELOAD of the
+        # case on screen goes back to disk
+        if self.patient is not None and self.patient.id == self.PATIENT_ID:
+            self.session.discard(self.PATIENT_ID)
+        entry = self.session.get(self.PATIENT_ID)
+        if entry is not None:
+            self.on_load_finished(entry.patient, entry.meshes)
+            return
+
+        self.loader_thread = LoadWorker(self.session, self.PATIENT_ID)
         self.loader_thread.progress.connect(self.update_progress)
         self.loader_thread.finished.connect(self.on_load_finished)
         self.loader_thread.error.connect(self.on_load_error)
@@ -366,105 +679,439 @@ class MainWindow(QMainWindow):
         self.btn_load.setEnabled(True)
         QMessageBox.critical(self, "Load Error", err_msg)
 
-    def on_load_finished(self, patient):
+    def on_load_finished(self, patient, meshes=None):
+        """Shows a loaded case; `meshes` (layer key -> LOD chain) are surfaces kept by the session cache."""
         self.patient = patient
-        self.progress_bar.setValue(80)
+        self.session.pinned = patient.id
+        self.progress_bar.setValue(LOAD_PROGRESS_SHARE)
         
+        self.init_viewer()
         self.plotter.clear()
         self.actors = {}
-        total_vol = 0
-        
-        # 1. Generate Brain Shell
-        brain_mesh = self.analyzer.get_brain_mesh_from_t1(patient)
-        if brain_mesh:
-            self.actors['brain'] = self.plotter.add_mesh(
-                brain_mesh, color="#eceff1", opacity=0.10, style='surface', smooth_shading=True
-            )
+        self.lods = {}
+        self.volume_actors = {}
+        self.meshed_patient = None
 
-        # 2. Generate Tumor Meshes (LOAD BUTONUNA BASILINCA ARTIK ÇİZMİYORUZ!)
-        # Değişiklik: Yüklemede sadece beyni çiziyoruz, tümörleri AI bulacak.
-        # Ama var olan GT'yi göstermek istersen burayı açabilirsin.
-        # Bizim senaryomuzda AI butonu şovu yapacağı için burayı pas geçiyoruz veya
-        # Sadece "Brain" yükleniyor, tümörler AI'a basınca gelecek gibi yapabiliriz.
-        # ŞİMDİLİK: Eski düzeni koruyalım, yüklemede her şey gelsin, AI butonu "Re-Run" yapsın.
-        
-        parts = [
-            ('necrotic', 1, '#ff5252', 1.0),
-            ('edema', 2, '#ffd740', 0.25),
-            ('active', 4, '#69f0ae', 1.0)
-        ]
-        
-        for key, lbl_id, color, opac in parts:
-            mesh = self.analyzer.get_mesh_from_mask(patient, lbl_id)
-            vol = self.analyzer.calculate_volume(patient, lbl_id)
-            total_vol += vol
-            
-            if mesh and mesh.n_points > 0:
-                self.actors[key] = self.plotter.add_mesh(
-                    mesh, color=color, opacity=opac, smooth_shading=True, specular=0.6
-                )
-
-        # 3. Update UI Metadata
+        # 1. Update UI Metadata (statistics were computed by the load worker)
+        stats = self.analyzer.compute_label_stats(patient)
+        total_vol = sum(stats[lbl_id].volume_cm3 for lbl_id, _, _ in LAYERS.values() if lbl_id in stats)
         self.lbl_total_vol.setText(f"Total Volume: {total_vol:.2f} cm³")
         sp = patient.spacing
         self.lbl_voxel_dim.setText(f"Spacing: {sp[0]:.1f}x{sp[1]:.1f}x{sp[2]:.1f} mm")
         self.meta_group.setVisible(True)
+        self.slice_panel.set_patient(patient)
+        self.slice_panel.setVisible(True)
+
+        # 2. Volume mode renders the volumes directly; surface mode builds the meshes
+        if self.render_mode == 'volume':
+            self.show_volumes()
+            self.progress_bar.setValue(100)
+            self.btn_ai.setEnabled(True)
+        else:
+            layers = {key: lbl_id for key, (lbl_id, _, _) in LAYERS.items()}
+            meshes = meshes or {}
+            self.start_meshing(patient, {key: lbl_id for key, lbl_id in layers.items() if key not in meshes})
+            # Cached surfaces go straight to the scene, in the generation start_meshing just opened
+            for key, lods in meshes.items():
+                self.on_mesh_ready(self.mesh_generation, key, lods)
+            if self.mesh_job is None:
+                self.progress_bar.setValue(100)
+                self.btn_ai.setEnabled(True)
 
-        self.plotter.add_axes()
-        self.plotter.reset_camera()
-        self.plotter.camera_position = 'iso'
-        
-        self.progress_bar.setValue(100)
         self.btn_load.setText(f"RELOAD CASE")
         self.btn_load.setEnabled(True)
-        
-        # --- AI BUTONUNU AKTİF ET ---
-        self.btn_ai.setEnabled(True)
+        self.prefetch_next_case()
+
+    def prefetch_next_case(self):
+        """Loads the case after the current one in the picker into the session cache."""
+        if not self.PREFETCH_NEXT:
+            return
+        index = self.patient_picker.findText(self.patient.id)
+        if 0 <= index < self.patient_picker.count() - 1:
+            self.session.prefetch(self.patient_picker.itemText(index + 1))
+
+    def start_meshing(self, patient, layers, previous=None, previous_meshes=None, diff=None):
+        """
+        Builds the given layers in the background.
+        A coarse preview (coarsest pyramid level) of each layer shows up first,
+        then the full-resolution surface replaces it (see on_mesh_ready).
+        With `previous` the layers are instead updated from `previous_meshes`
+        (incremental re-meshing of a mask change), without previews.
+        """
+        if self.mesh_job is not None:
+            self.mesh_job.cancel()
+
+        self.meshed_patient = patient
+        self.mesh_generation += 1
+        generation = self.mesh_generation
+        if not layers:
+            self.mesh_job = None
+            return
+        self.mesh_job = self.mesh_pipeline.submit(
+            patient, layers,
+            on_ready=lambda key, lods: self.mesh_signals.mesh_ready.emit(generation, key, lods),
+            on_progress=lambda done, total: self.mesh_signals.progress.emit(generation, done, total),
+            preview_factor=max(PYRAMID_FACTORS) if previous is None else None,
+            previous=previous, previous_meshes=previous_meshes, diff=diff
+        )
+
+    def on_mesh_ready(self, generation, key, lods):
+        """Adds (or refines) one layer in the scene. Runs on the GUI thread."""
+        if generation != self.mesh_generation:
+            return
+
+        lbl_id, color, default_opacity = LAYERS[key]
+        cb, slider = self.layer_controls.get(key, (None, None))
+        opacity = slider.value() / 100.0 if slider is not None else default_opacity
+
+        # The LOD chain arrives after the full mesh: keep the actor of the
+        # same full mesh and only add the coarser levels.
+        is_new = key not in self.actors
+        previous = self.lods.get(key)
+        refining = bool(previous) and previous[0] is lods[0]
+        if refining:
+            for actor in self.actors[key][1:]:
+                self.plotter.remove_actor(actor)
+            actors = self.actors[key][:1]
+            new_lods = lods[1:]
+        else:
+            # A full-resolution mesh replaces the preview; a re-meshed layer (AI result) its previous actors
+            self.remove_layer(key)
+            actors = []
+            new_lods = lods
+
+        with span("add_actor", layer=key, lods=len(new_lods)):
+            for mesh in new_lods:
+                if lbl_id is None:
+                    actor = self.plotter.add_mesh(
+                        mesh, color=color, opacity=opacity, style='surface', smooth_shading=True
+                    )
+                else:
+                    actor = self.plotter.add_mesh(
+                        mesh, color=color, opacity=opacity, smooth_shading=True, specular=0.6
+                    )
+                actors.append(actor)
+
+        first_actor = not self.actors and not self.volume_actors
+        self.actors[key] = actors
+        self.lods[key] = list(lods)
+        self.apply_lod(key)
+
+        # Frame the first layer that arrives, and re-frame once the brain shell
+        # (which encloses everything else) shows up.
+        if first_actor:
+            self.plotter.add_axes()
+            self.plotter.reset_camera()
+            self.plotter.camera_position = 'iso'
+        elif key == 'brain' and is_new:
+            self.plotter.reset_camera()
+
+    def on_mesh_progress(self, generation, done, total):
+        if generation != self.mesh_generation:
+            return
+
+        self.progress_bar.setValue(LOAD_PROGRESS_SHARE + int((100 - LOAD_PROGRESS_SHARE) * done / total))
+
+        if done == total:
+            self.mesh_job = None
+            # Surfaces of a case as loaded are kept with it in the session cache
+            self.session.put_meshes(self.meshed_patient, self.lods)
+            # --- AI BUTONUNU AKTİF ET ---
+            self.btn_ai.setEnabled(True)
 
     def run_ai_segmentation(self):
         """AI Butonuna basıldığında çalışan fonksiyon."""
         if self.patient is None: return
 
+        # Clicks while a job runs are queued and run one after another
+        self.ai_queue.append((self.case_generation, self.patient))
+        if self.ai_worker is None:
+            self.start_next_ai()
+        else:
+            self.btn_ai.setText(f"PROCESSING (NEURAL NET)... +{len(self.ai_queue)} QUEUED")
+
+    def start_next_ai(self):
+        # Requests made for a case that has since been replaced are skipped
+        while self.ai_queue and self.ai_queue[0][0] != self.case_generation:
+            self.ai_queue.popleft()
+        if not self.ai_queue:
+            self.btn_ai_cancel.setVisible(False)
+            return
+
+        generation, patient = self.ai_queue.popleft()
+
         # UI Güncelleme (Processing...)
-        original_text = self.btn_ai.text()
         self.btn_ai.setText("PROCESSING (NEURAL NET)...")
-        self.btn_ai.setEnabled(False)
-        QApplication.processEvents() # Arayüzün donmasını engelle, yazıyı güncelle
+        self.btn_ai.setStyleSheet("")
+        self.btn_ai_cancel.setVisible(True)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
 
-        # Inference Çalıştır
-        # Not: segmentor.predict zaten maske döndürüyor.
-        # Bizim görselleştirme kodumuz zaten maskeyi kullanıyor.
-        # Burada maksat "İşlem yapıldı" hissi vermek.
-        try:
-            mask = self.segmentor.predict(self.patient)
-            
-            if mask is not None:
-                # Başarılı olduğunda
-                self.btn_ai.setText("AI DIAGNOSIS COMPLETE")
-                self.btn_ai.setStyleSheet(f"background-color: #00c853; color: white; border: 1px solid #00c853;")
-                
-                QMessageBox.information(self, "AI Inference Result", 
-                    "<b>U-Net Model Inference Successful.</b><br><br>"
-                    "Segmentation masks have been generated and overlaid on the 3D volume.<br>"
-                    "Analysis indicates presence of High-Grade Glioma regions.")
+        worker = InferenceWorker(self.get_segmentor, self.analyzer, patient)
+        worker.stage.connect(lambda stage, done, total, gen=generation: self.on_ai_stage(gen, stage, done, total))
+        worker.result.connect(lambda predicted, diff, gen=generation, source=patient:
+                              self.on_ai_finished(gen, source, predicted, diff))
+        worker.cancelled.connect(lambda gen=generation: self.on_ai_cancelled(gen))
+        worker.error.connect(lambda msg, gen=generation: self.on_ai_error(gen, msg))
+        # The thread object is dropped only after run() has returned
+        worker.finished.connect(self.on_ai_done)
+        self.ai_worker = worker
+        worker.start()
+
+    def on_ai_stage(self, generation, stage, done, total):
+        if generation != self.case_generation:
+            return
+        lo, hi = AI_STAGE_PROGRESS[stage]
+        self.progress_bar.setValue(lo + int((hi - lo) * done / max(total, 1)))
+        queued = f" +{len(self.ai_queue)} QUEUED" if self.ai_queue else ""
+        self.btn_ai.setText(f"AI: {stage.upper()} {done}/{total}{queued}")
+
+    def on_ai_finished(self, generation, source, predicted, diff):
+        if generation == self.case_generation:
+            self.show_ai_result(predicted, source, diff)
+
+    def on_ai_error(self, generation, err_msg):
+        if generation == self.case_generation:
+            QMessageBox.critical(self, "AI Error", err_msg)
+            self.btn_ai.setText("AI FAILED")
+
+    def on_ai_cancelled(self, generation):
+        if generation == self.case_generation:
+            self.btn_ai.setText("RUN AI DIAGNOSIS")
+
+    def on_ai_done(self):
+        """QThread.finished of the current worker: its thread has exited, start the next job."""
+        worker, self.ai_worker = self.ai_worker, None
+        if worker is not None:
+            worker.deleteLater()
+        self.start_next_ai()
+
+    def cancel_ai(self):
+        self.ai_queue.clear()
+        if self.ai_worker is not None:
+            self.ai_worker.cancel()
+
+    def show_ai_result(self, predicted, source=None, diff=None):
+        """
+        Swaps in the predicted mask and re-renders only the tumor labels; the brain shell stays.
+        If the surfaces on screen belong to `source` (the mask the prediction was diffed
+        against), only the changed labels are re-meshed, spliced into those surfaces.
+        In volume mode only the label volume is rebuilt, surfaces follow when switching back.
+        """
+        self.patient = predicted
+
+        # Başarılı olduğunda
+        self.btn_ai.setText("AI DIAGNOSIS COMPLETE")
+        self.btn_ai.setStyleSheet(f"background-color: #00c853; color: white; border: 1px solid #00c853;")
+
+        stats = predicted.label_stats
+        total_vol = sum(stats[lbl_id].volume_cm3 for lbl_id, _, _ in LAYERS.values() if lbl_id in stats)
+        self.lbl_total_vol.setText(f"Total Volume: {total_vol:.2f} cm³")
+        self.slice_panel.set_patient(predicted)
+
+        if self.render_mode == 'volume':
+            if 'labels' in self.volume_actors:
+                self.plotter.remove_actor(self.volume_actors.pop('labels'))
+            self.show_volumes()
+        else:
+            layers = self.tumor_layers(predicted)
+            if diff is not None and source is self.meshed_patient and self.mesh_job is None:
+                meshes = {key: self.lods[key][0] for key in layers if self.lods.get(key)}
+                layers = {key: lbl_id for key, lbl_id in layers.items()
+                          if lbl_id in diff.changed_labels or key not in meshes}
+                self.start_meshing(predicted, layers, previous=source, previous_meshes=meshes, diff=diff)
             else:
-                self.btn_ai.setText("AI FAILED")
-                
-        except Exception as e:
-            QMessageBox.critical(self, "AI Error", str(e))
-            self.btn_ai.setText(original_text)
-            self.btn_ai.setEnabled(True)
+                self.start_meshing(predicted, layers)
+
+    def tumor_layers(self, patient):
+        """Mask layers to mesh for a patient; surfaces of labels it lacks are dropped."""
+        stats = self.analyzer.compute_label_stats(patient)
+        layers = {}
+        for key, (lbl_id, _, _) in LAYERS.items():
+            if lbl_id is None:
+                continue
+            if lbl_id in stats:
+                layers[key] = lbl_id
+            else:
+                # Label absent from the mask: nothing to mesh, drop the old surface
+                self.remove_layer(key)
+        return layers
+
+    # --- RENDER MODES ---
+
+    def toggle_render_mode(self):
+        if self.render_mode == 'surface':
+            self.render_mode = 'volume'
+            self.btn_render_mode.setText("SWITCH TO SURFACE MESHES")
+            if self.patient is not None:
+                self.show_volumes()
+        else:
+            self.render_mode = 'surface'
+            self.btn_render_mode.setText("SWITCH TO VOLUME RENDERING")
+            if self.patient is not None:
+                self.show_surfaces()
+
+    def show_volumes(self):
+        """Ray-casts the T1 volume and the label volume; surface actors are hidden, not removed."""
+        from src.core.volume_render import intensity_volume, label_volume
+        self.init_viewer()
+        first_view = not self.actors and not self.volume_actors
+
+        with span("add_actor", case=self.patient.id, volume=True):
+            if 'brain' not in self.volume_actors:
+                grid = intensity_volume(self.patient)
+                if grid is not None:
+                    self.volume_actors['brain'] = self.plotter.add_volume(
+                        grid, mapper='smart', show_scalar_bar=False, reset_camera=False)
+            if 'labels' not in self.volume_actors:
+                grid = label_volume(self.patient)
+                if grid is not None:
+                    self.volume_actors['labels'] = self.plotter.add_volume(
+                        grid, mapper='smart', show_scalar_bar=False, reset_camera=False)
+
+        for actor in self.volume_actors.values():
+            actor.SetVisibility(True)
+        self.update_volume_transfer()
+        for key in self.actors:
+            self.apply_lod(key)
+
+        if first_view:
+            self.plotter.add_axes()
+            self.plotter.reset_camera()
+            self.plotter.camera_position = 'iso'
+        self.plotter.render()
+
+    def show_surfaces(self):
+        """Hides the volumes and shows the meshes, building any that are missing or stale."""
+        for actor in self.volume_actors.values():
+            actor.SetVisibility(False)
+        for key in self.actors:
+            self.apply_lod(key)
+
+        if self.meshed_patient is not self.patient:
+            if 'brain' in self.actors:
+                self.start_meshing(self.patient, self.tumor_layers(self.patient))
+            else:
+                self.start_meshing(self.patient, {key: lbl_id for key, (lbl_id, _, _) in LAYERS.items()})
+        self.plotter.render()
+
+    def update_volume_transfer(self):
+        """Rebuilds the volume transfer functions from the layer checkboxes and opacity sliders."""
+        from src.core.volume_render import intensity_transfer, label_transfer, apply_transfer
+        def layer_opacity(key):
+            cb, slider = self.layer_controls[key]
+            return slider.value() / 100.0 if cb.isChecked() else 0.0
+
+        if 'brain' in self.volume_actors:
+            ctf, otf = intensity_transfer(LAYERS['brain'][1], layer_opacity('brain'))
+            apply_transfer(self.volume_actors['brain'], ctf, otf)
+        if 'labels' in self.volume_actors:
+            labels = {lbl_id: (color, layer_opacity(key))
+                      for key, (lbl_id, color, _) in LAYERS.items() if lbl_id is not None}
+            ctf, otf = label_transfer(labels)
+            apply_transfer(self.volume_actors['labels'], ctf, otf, nearest=True)
+
+    def remove_layer(self, key):
+        for actor in self.actors.pop(key, []):
+            self.plotter.remove_actor(actor)
+        self.lods.pop(key, None)
+
+    def apply_lod(self, key):
+        """Shows the one actor of the layer matching the interaction state, if the layer is enabled."""
+        actors = self.actors.get(key, [])
+        cb, _ = self.layer_controls.get(key, (None, None))
+        visible = (cb is None or cb.isChecked()) and self.render_mode == 'surface'
+        level = len(actors) - 1 if self.interacting else 0
+        for i, actor in enumerate(actors):
+            actor.SetVisibility(visible and i == level)
+
+    def on_render_start(self, obj=None, event=None):
+        self.on_render_end()
+        self.render_span = span("render")
+        self.render_span.__enter__()
+
+    def on_render_end(self, obj=None, event=None):
+        if self.render_span is not None:
+            self.render_span.__exit__(None, None, None)
+            self.render_span = None
+
+    def on_interaction_start(self, obj=None, event=None):
+        self.interacting = True
+        for key in self.actors:
+            self.apply_lod(key)
+
+    def on_interaction_end(self, obj=None, event=None):
+        self.interacting = False
+        for key in self.actors:
+            self.apply_lod(key)
+        self.plotter.render()
+
+    def update_slice_overlay(self):
+        """Label overlay of the slice panes, following the tumor layer checkboxes and sliders."""
+        labels = {}
+        for key, (lbl_id, color, _) in LAYERS.items():
+            if lbl_id is None or key not in self.layer_controls:
+                continue
+            cb, slider = self.layer_controls[key]
+            opacity = slider.value() / 100.0 if cb.isChecked() else 0.0
+            labels[lbl_id] = (QColor(color).getRgb()[:3], opacity)
+        self.slice_panel.set_overlay(labels)
 
     def toggle_visibility(self, key, state):
         if key in self.actors:
-            self.actors[key].SetVisibility(state == Qt.Checked)
+            self.apply_lod(key)
+        if LAYERS[key][0] is not None:
+            self.update_slice_overlay()
+        if self.volume_actors:
+            self.update_volume_transfer()
+        if key in self.actors or self.volume_actors:
             self.plotter.update()
 
     def update_opacity(self, key, value):
-        if key in self.actors:
-            self.actors[key].GetProperty().SetOpacity(value / 100.0)
+        for actor in self.actors.get(key, []):
+            actor.GetProperty().SetOpacity(value / 100.0)
+        if LAYERS[key][0] is not None:
+            self.update_slice_overlay()
+        if self.volume_actors:
+            self.update_volume_transfer()
+        if key in self.actors or self.volume_actors:
             self.plotter.update()
 
+    def toggle_timing_panel(self, state):
+        visible = state == Qt.Checked
+        self.timing_panel.setVisible(visible)
+        if visible:
+            self.refresh_timings()
+            self.timing_timer.start()
+        else:
+            self.timing_timer.stop()
+
+    def refresh_timings(self):
+        self.timing_text.setPlainText(TRACER.format_summary())
+
+    def clear_trace(self):
+        TRACER.clear()
+        self.refresh_timings()
+
+    def export_trace(self):
+        """Saves the recorded spans as Chrome trace JSON (chrome://tracing, ui.perfetto.dev)."""
+        path, _ = QFileDialog.getSaveFileName(self, "Export trace", "neurovoxel_trace.json", "JSON (*.json)")
+        if path:
+            TRACER.export_chrome_trace(path)
+            print(f"Trace written to {path}")
+
+    def closeEvent(self, event):
+        if self.mesh_job is not None:
+            self.mesh_job.cancel()
+        self.cancel_ai()
+        if self.ai_worker is not None:
+            self.ai_worker.wait()
+        if self.mesh_pipeline is not None:
+            self.mesh_pipeline.shutdown()
+        if self.plotter is not None:
+            self.plotter.close()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
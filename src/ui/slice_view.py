@@ -0,0 +1,157 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QSlider, QComboBox, QSizePolicy
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QImage, QPixmap
+
+from src.core.slices import VIEW_AXES, SliceRenderer, slice_spacing
+
+# Window change per pixel of right-button drag, as a fraction of the current window width
+WINDOW_DRAG_RATE = 0.005
+
+class SlicePane(QWidget):
+    """
+    One orthogonal view: the slice image and a slider over the stack.
+    Mouse wheel steps through slices, right-button drag changes window (x) and level (y).
+    """
+    def __init__(self, panel, view):
+        super().__init__()
+        self.panel = panel
+        self.view = view
+        self.drag_start = None
+
+        vbox = QVBoxLayout(self)
+        vbox.setContentsMargins(4, 4, 4, 4)
+        vbox.setSpacing(4)
+
+        self.title = QLabel(view.upper())
+        self.title.setStyleSheet("color: #78909c; font-size: 8pt; font-weight: bold;")
+        vbox.addWidget(self.title)
+
+        self.image = QLabel()
+        self.image.setAlignment(Qt.AlignCenter)
+        self.image.setMinimumSize(QSize(120, 120))
+        self.image.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.image.setStyleSheet("background-color: #000000;")
+        vbox.addWidget(self.image, 1)
+
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(0, 0)
+        self.slider.valueChanged.connect(self.refresh)
+        vbox.addWidget(self.slider)
+
+    def reset(self, n_slices):
+        self.slider.blockSignals(True)
+        self.slider.setRange(0, n_slices - 1)
+        self.slider.setValue(n_slices // 2)
+        self.slider.blockSignals(False)
+
+    def refresh(self):
+        renderer = self.panel.renderer
+        if renderer is None:
+            return
+        index = self.slider.value()
+        rgb = renderer.render(self.view, index)
+        self.title.setText(f"{self.view.upper()}  {index + 1}/{self.slider.maximum() + 1}")
+
+        rows, cols = rgb.shape[:2]
+        # QImage wraps the cached array without copying; fromImage makes the only copy
+        image = QImage(rgb.data, cols, rows, 3 * cols, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(image)
+
+        # Anisotropic voxels: stretch to physical size, then fit the pane
+        row_sp, col_sp = slice_spacing(renderer.patient.spacing, self.view)
+        target = QSize(int(round(cols * col_sp)), int(round(rows * row_sp)))
+        target.scale(self.image.size(), Qt.KeepAspectRatio)
+        self.image.setPixmap(pixmap.scaled(target, Qt.IgnoreAspectRatio, Qt.FastTransformation))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.refresh()
+
+    def wheelEvent(self, event):
+        step = 1 if event.angleDelta().y() > 0 else -1
+        self.slider.setValue(self.slider.value() + step)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.RightButton and self.panel.renderer is not None:
+            self.drag_start = (event.pos(), self.panel.renderer.window)
+
+    def mouseMoveEvent(self, event):
+        if self.drag_start is None:
+            return
+        start, (lo, hi) = self.drag_start
+        width, level = hi - lo, (hi + lo) / 2.0
+        delta = event.pos() - start
+        width = max(width * (1.0 + delta.x() * WINDOW_DRAG_RATE), 1.0)
+        level -= delta.y() * WINDOW_DRAG_RATE * width
+        self.panel.set_window((level - width / 2.0, level + width / 2.0))
+
+    def mouseReleaseEvent(self, event):
+        self.drag_start = None
+
+class SlicePanel(QWidget):
+    """Axial, coronal and sagittal panes of the loaded case, with a modality picker."""
+    def __init__(self):
+        super().__init__()
+        self.renderer = None
+        self.overlay = {}
+
+        hbox = QHBoxLayout(self)
+        hbox.setContentsMargins(0, 0, 0, 0)
+        hbox.setSpacing(2)
+
+        self.modality_picker = QComboBox()
+        self.modality_picker.currentTextChanged.connect(self.set_modality)
+        picker_box = QVBoxLayout()
+        picker_box.addWidget(self.modality_picker)
+        picker_box.addStretch()
+        hbox.addLayout(picker_box)
+
+        self.panes = {view: SlicePane(self, view) for view in VIEW_AXES}
+        for pane in self.panes.values():
+            hbox.addWidget(pane, 1)
+
+    def set_patient(self, patient):
+        """
+        Shows a case. A new mask of the same case (AI result) keeps the
+        slice positions, modality and window.
+        """
+        previous = self.renderer
+        self.renderer = SliceRenderer(patient)
+        self.renderer.set_overlay(self.overlay)
+
+        same_case = previous is not None and previous.patient.id == patient.id and previous.shape == self.renderer.shape
+        if same_case:
+            self.renderer.modality = previous.modality
+            if previous.window is not None:
+                self.renderer.set_window(previous.window)
+        else:
+            for view, pane in self.panes.items():
+                pane.reset(self.renderer.n_slices(view))
+
+        self.modality_picker.blockSignals(True)
+        self.modality_picker.clear()
+        self.modality_picker.addItems(list(patient.modalities))
+        self.modality_picker.setCurrentText(self.renderer.modality or "")
+        self.modality_picker.blockSignals(False)
+        self.refresh()
+
+    def set_modality(self, modality):
+        if self.renderer is not None and modality:
+            self.renderer.set_modality(modality)
+            self.refresh()
+
+    def set_window(self, window):
+        if self.renderer is not None:
+            self.renderer.set_window(window)
+            self.refresh()
+
+    def set_overlay(self, labels):
+        """Label colors/opacities: {label: ((r, g, b), opacity)}."""
+        self.overlay = labels
+        if self.renderer is not None:
+            self.renderer.set_overlay(labels)
+            self.refresh()
+
+    def refresh(self):
+        for pane in self.panes.values():
+            pane.refresh()
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+import numpy as np
+
+# Benchmark suite on synthetic BraTS-shaped cases (240x240x155, four modalities,
+# nested ellipsoid tumor labels), written to a temp dir as .nii and .nii.gz.
+# Every stage is timed (wall + CPU, median of the repeats) and memory-profiled
+# (tracemalloc peak of numpy/Python allocations, peak RSS growth for torch).
+# Results go to a JSON file; with a baseline, any stage slower or hungrier than
+# baseline * (1 + tolerance) is a regression and the exit code is 1.
+# Usage:
+#   python test/benchmark.py                      # run, compare with the stored baseline
+#   python test/benchmark.py --save-baseline      # run and store the results as the new baseline
+#   python test/benchmark.py --stages load_nii mesh_label --repeats 5
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results.json")
+
+SHAPE = (240, 240, 155)
+SPACING = (1.0, 1.0, 1.0)
+# (center, radii) of the brain and of the tumor shells, outermost first: edema, necrotic core, enhancing
+BRAIN = ((120, 120, 77), (75, 95, 65))
+TUMOR = [
+    (2, (150, 105, 80), (30, 26, 22)),
+    (4, (152, 104, 80), (16, 14, 12)),
+    (1, (153, 104, 80), (9, 8, 7))
+]
+# Modality intensities (brain, tumor) so that every channel carries contrast
+CONTRAST = {'t1': (600, 450), 't1ce': (650, 1100), 't2': (500, 900), 'flair': (400, 950)}
+
+# Slack for the memory comparison, so tiny stages do not flag on allocator noise
+MEMORY_SLACK_MB = 2.0
+RSS_SAMPLE_S = 0.005
+
+def ellipsoid(center, radii, shape=SHAPE):
+    x, y, z = np.ogrid[:shape[0], :shape[1], :shape[2]]
+    return (((x - center[0]) / radii[0]) ** 2 +
+            ((y - center[1]) / radii[1]) ** 2 +
+            ((z - center[2]) / radii[2]) ** 2) <= 1.0
+
+def make_case(root, patient_id, compressed, seed=0):
+    """Writes one synthetic case: four int16 modalities and a uint8 _seg.nii mask."""
+    import nibabel as nib
+
+    rng = np.random.default_rng(seed)
+    case_dir = os.path.join(root, patient_id)
+    os.makedirs(case_dir, exist_ok=True)
+    affine = np.diag(list(SPACING) + [1.0])
+
+    brain = ellipsoid(*BRAIN)
+    mask = np.zeros(SHAPE, dtype=np.uint8)
+    for label, center, radii in TUMOR:
+        mask[ellipsoid(center, radii) & brain] = label
+
+    ext = ".nii.gz" if compressed else ".nii"
+    for name, (tissue, tumor) in CONTRAST.items():
+        data = rng.normal(tissue, 40, SHAPE).astype(np.float32)
+        data[mask > 0] += tumor - tissue
+        data[~brain] = 0
+        nib.save(nib.Nifti1Image(data.astype(np.int16), affine), os.path.join(case_dir, f"{patient_id}_{name}{ext}"))
+    # The loader looks the mask up as *_seg.nii
+    nib.save(nib.Nifti1Image(mask, affine), os.path.join(case_dir, f"{patient_id}_seg.nii"))
+
+class RssSampler:
+    """Peak resident set size during a block, sampled from /proc (None where unavailable)."""
+    def __init__(self):
+        self.peak = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            value = self.rss()
+            if value is not None:
+                self.peak = max(self.peak or 0, value)
+            time.sleep(RSS_SAMPLE_S)
+
+    def __enter__(self):
+        self.start = self.rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        end = self.rss()
+        if end is not None:
+            self.peak = max(self.peak or 0, end)
+
+    @property
+    def growth_mb(self):
+        if self.start is None or self.peak is None:
+            return None
+        return max(self.peak - self.start, 0) / 1e6
+
+def measure(setup, run, repeats):
+    """Median wall/CPU time over `repeats` runs (after one warm-up), then one profiled run."""
+    run(*setup())
+    walls, cpus = [], []
+    for _ in range(repeats):
+        args = setup()
+        t_wall, t_cpu = time.perf_counter(), time.process_time()
+        run(*args)
+        walls.append(time.perf_counter() - t_wall)
+        cpus.append(time.process_time() - t_cpu)
+
+    args = setup()
+    tracemalloc.start()
+    with RssSampler() as rss:
+        run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_s": float(np.median(walls)),
+        "wall_min_s": float(min(walls)),
+        "cpu_s": float(np.median(cpus)),
+        "peak_alloc_mb": peak / 1e6,
+        "peak_rss_mb": rss.growth_mb
+    }
+
+def build_stages(root, patch):
+    """name -> (setup() -> args, run(*args)). Torch stages are left out when torch is missing."""
+    from src.loaders.brats_loader import BraTSLoader
+    from src.core.analyzer import VolumeAnalyzer
+
+    loader = BraTSLoader(root)
+    analyzer = VolumeAnalyzer()
+    patient = loader.load_patient("bench_nii")
+    analyzer.compute_label_stats(patient)
+
+    def fresh_stats():
+        patient.label_stats = None
+        return (patient,)
+
+    stages = {
+        "load_nii": (lambda: ("bench_nii",), loader.load_patient),
+        "load_nii_gz": (lambda: ("bench_gz",), loader.load_patient),
+        "calculate_volume": (fresh_stats, lambda p: analyzer.calculate_volume(p, 2)),
+        "mesh_label": (lambda: (patient,), lambda p: analyzer.get_mesh_from_mask(p, 2)),
+        "mesh_brain": (lambda: (patient,), analyzer.get_brain_mesh_from_t1),
+    }
+
+    try:
+        import torch
+    except ImportError:
+        print("torch not installed: skipping preprocess and unet_forward")
+        return stages
+
+    from src.ai.inference import TumorSegmentor
+    from src.ai.model import Simple3DUNet
+    from src.core.structure import BRATS_LABELS
+
+    segmentor = TumorSegmentor(patch_size=(patch,) * 3)
+    model = Simple3DUNet(in_channels=4, out_channels=len(BRATS_LABELS)).eval()
+    batch = torch.randn(1, 4, patch, patch, patch)
+
+    def forward(x):
+        with torch.no_grad():
+            return model(x)
+
+    stages["preprocess"] = (lambda: (patient,), segmentor.preprocess)
+    stages["unet_forward"] = (lambda: (batch,), forward)
+    return stages
+
+def compare(results, baseline, tolerance):
+    """Stages whose time or memory exceeds the baseline by more than `tolerance`."""
+    regressions = []
+    for name, current in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+        if current["wall_s"] > base["wall_s"] * (1.0 + tolerance):
+            regressions.append(f"{name}: wall {current['wall_s']:.3f}s vs baseline {base['wall_s']:.3f}s")
+        for key in ("peak_alloc_mb", "peak_rss_mb"):
+            if current.get(key) is None or base.get(key) is None:
+                continue
+            if current[key] > base[key] * (1.0 + tolerance) + MEMORY_SLACK_MB:
+                regressions.append(f"{name}: {key} {current[key]:.1f} vs baseline {base[key]:.1f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic-data benchmark of loader, analyzer and AI stages.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per stage (median is reported)")
+    parser.add_argument("--stages", nargs="+", default=None, help="Only these stages")
+    parser.add_argument("--patch", type=int, default=64, help="Edge of the U-Net forward input")
+    parser.add_argument("--out", default=DEFAULT_RESULTS, help="Results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed slowdown / memory growth (0.3 = 30%%)")
+    args = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix="neurovoxel_bench_")
+    try:
+        print(f"---- Benchmark (synthetic {SHAPE[0]}x{SHAPE[1]}x{SHAPE[2]} cases in {root}) ----")
+        make_case(root, "bench_nii", compressed=False, seed=0)
+        make_case(root, "bench_gz", compressed=True, seed=1)
+
+        stages = build_stages(root, args.patch)
+        if args.stages:
+            unknown = set(args.stages) - set(stages)
+            if unknown:
+                parser.error(f"unknown stages: {', '.join(sorted(unknown))} (available: {', '.join(stages)})")
+            stages = {name: stages[name] for name in args.stages}
+
+        results = {
+            "machine": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count()
+            },
+            "repeats": args.repeats,
+            "stages": {}
+        }
+        print(f"{'stage':<18}{'wall (s)':>10}{'cpu (s)':>10}{'alloc (MB)':>12}{'rss (MB)':>10}")
+        for name, (setup, run) in stages.items():
+            r = measure(setup, run, args.repeats)
+            results["stages"][name] = r
+            rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+            print(f"{name:<18}{r['wall_s']:>10.3f}{r['cpu_s']:>10.3f}{r['peak_alloc_mb']:>12.1f}{rss:>10}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults: {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet (run with --save-baseline to store one)")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n REGRESSIONS (> {args.tolerance:.0%} over baseline):")
+        for line in regressions:
+            print(f"   -> {line}")
+        return 1
+    print(f"\n No regressions against the baseline (tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
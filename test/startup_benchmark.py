@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+# Time-to-first-window of the GUI, measured in fresh processes.
+#   deferred: current startup (viewer right after the first show, AI engine built on first use / in background)
+#   eager:    the old startup order, where the viewer and the AI engine are built before the window is shown
+# Usage: python test/startup_benchmark.py [repeats]
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ('torch', 'onnxruntime', 'nibabel', 'pyvista', 'pyvistaqt', 'vtk')
+
+def run_child(mode):
+    t_start = time.perf_counter()
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    sys.path.insert(0, PROJECT_ROOT)
+
+    from PyQt5.QtWidgets import QApplication
+    import src.ui.main_window as main_window
+    t_import = time.perf_counter()
+
+    app = QApplication(sys.argv)
+    window = main_window.MainWindow()
+    window.WARM_UP_AI = False
+    if mode == 'eager':
+        window.init_viewer()
+        window.get_segmentor()
+    window.show()
+    app.processEvents()
+    t_window = time.perf_counter()
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    # Let the deferred work finish, to report when everything is ready
+    while window.plotter is None:
+        app.processEvents()
+    window.get_segmentor()
+    t_ready = time.perf_counter()
+
+    window.close()
+    print(json.dumps({
+        "import_s": t_import - t_start,
+        "first_window_s": t_window - t_start,
+        "ready_s": t_ready - t_start,
+        "loaded_at_first_window": loaded
+    }))
+
+def measure(mode, repeats):
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, __file__, '--child', mode], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["first_window_s"])
+    return best
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"---- Startup Benchmark (best of {repeats}) ----")
+    print(f"{'mode':<10}{'import (s)':>12}{'1st window (s)':>16}{'all ready (s)':>15}  heavy modules at first window")
+
+    results = {}
+    for mode in ('eager', 'deferred'):
+        r = measure(mode, repeats)
+        results[mode] = r
+        print(f"{mode:<10}{r['import_s']:>12.2f}{r['first_window_s']:>16.2f}{r['ready_s']:>15.2f}  "
+              f"{', '.join(r['loaded_at_first_window']) or '-'}")
+
+    speedup = results['eager']['first_window_s'] / results['deferred']['first_window_s']
+    print(f"\n Time to first window: {speedup:.1f}x faster with deferred startup")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        run_child(sys.argv[2])
+    else:
+        main()